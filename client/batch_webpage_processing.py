@@ -0,0 +1,164 @@
+import collections
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from carbon.util import SettableValueHolder
+from flask import Response
+from flask import request
+from google.protobuf import json_format
+
+_processState = {}
+
+
+class WebpageTimeoutError(Exception):
+    pass
+
+
+def _raise_webpage_timeout(signalNumber, frame):  # pylint: disable=unused-argument
+    raise WebpageTimeoutError()
+
+
+def _initialize_process(webpageProcessorFactory):
+    requestIdHolder = SettableValueHolder(value=None)
+    serviceJwtHolder = SettableValueHolder(value=None)
+    _processState['requestIdHolder'] = requestIdHolder
+    _processState['serviceJwtHolder'] = serviceJwtHolder
+    _processState['webpageProcessor'] = webpageProcessorFactory(requestIdHolder=requestIdHolder, serviceJwtHolder=serviceJwtHolder)
+    signal.signal(signal.SIGALRM, _raise_webpage_timeout)
+
+
+def _process_webpage(url, requestId, serviceJwt, timeoutSeconds):
+    _processState['requestIdHolder'].set_value(value=requestId)
+    _processState['serviceJwtHolder'].set_value(value=serviceJwt)
+    signal.setitimer(signal.ITIMER_REAL, timeoutSeconds)
+    try:
+        return url, json_format.MessageToDict(_processState['webpageProcessor'].process_webpage(url=url)), None
+    except WebpageTimeoutError:
+        logging.warning('Timed out processing webpage %s after %ss', url, timeoutSeconds)
+        return url, None, 'Timed out after {}s'.format(timeoutSeconds)
+    except Exception as exception:  # pylint: disable=broad-except
+        logging.exception('Failed to process webpage %s', url)
+        return url, None, str(exception)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _put_result(resultQueue, index, result):
+    resultQueue.put((index, result))
+
+
+def _put_error(resultQueue, index, url, exception):
+    resultQueue.put((index, (url, None, str(exception))))
+
+
+def _get_default_process_count():
+    if os.environ.get('WEBPAGE_PROCESS_COUNT'):
+        return int(os.environ['WEBPAGE_PROCESS_COUNT'])
+    try:
+        import uwsgi  # pylint: disable=import-error
+        workerCount = uwsgi.numproc
+    except ImportError:
+        workerCount = 1
+    return max(1, multiprocessing.cpu_count() // workerCount)
+
+
+class BatchWebpageProcessor:
+
+    def __init__(self, requestIdHolder, serviceJwtHolder, webpageProcessorFactory, processCount=None, maxBatchSize=500, maxInFlightPerRequest=None, taskTimeoutSeconds=60, taskTimeoutGraceSeconds=10):
+        self.requestIdHolder = requestIdHolder
+        self.serviceJwtHolder = serviceJwtHolder
+        self.webpageProcessorFactory = webpageProcessorFactory
+        self.processCount = processCount or _get_default_process_count()
+        self.maxBatchSize = maxBatchSize
+        self.maxInFlightPerRequest = maxInFlightPerRequest or self.processCount
+        self.taskTimeoutSeconds = taskTimeoutSeconds
+        self.taskTimeoutGraceSeconds = taskTimeoutGraceSeconds
+        self.pool = None
+
+    def start(self):
+        if self.pool is None:
+            context = multiprocessing.get_context('fork')
+            self.pool = context.Pool(processes=self.processCount, initializer=_initialize_process, initargs=(self.webpageProcessorFactory,))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def process_webpages(self, urls):
+        if self.pool is None:
+            raise RuntimeError('BatchWebpageProcessor.start() must be called before processing webpages')
+        if len(urls) > self.maxBatchSize:
+            raise ValueError('At most {} urls can be processed in one batch'.format(self.maxBatchSize))
+        return self._iterate_results(urls=urls, requestId=self.requestIdHolder.get_value(), serviceJwt=self.serviceJwtHolder.get_value())
+
+    def _submit(self, resultQueue, index, url, requestId, serviceJwt):
+        self.pool.apply_async(_process_webpage, kwds={'url': url, 'requestId': requestId, 'serviceJwt': serviceJwt, 'timeoutSeconds': self.taskTimeoutSeconds}, callback=functools.partial(_put_result, resultQueue, index), error_callback=functools.partial(_put_error, resultQueue, index, url))
+
+    def _iterate_results(self, urls, requestId, serviceJwt):
+        resultQueue = queue.Queue()
+        remainingUrls = collections.deque(enumerate(urls))
+        pendingDeadlines = {}
+        try:
+            while remainingUrls or pendingDeadlines:
+                while remainingUrls and len(pendingDeadlines) < self.maxInFlightPerRequest:
+                    index, url = remainingUrls.popleft()
+                    pendingDeadlines[index] = (url, time.time() + self.taskTimeoutSeconds + self.taskTimeoutGraceSeconds)
+                    self._submit(resultQueue=resultQueue, index=index, url=url, requestId=requestId, serviceJwt=serviceJwt)
+                nextDeadline = min(deadline for _, deadline in pendingDeadlines.values())
+                try:
+                    index, result = resultQueue.get(timeout=max(0, nextDeadline - time.time()))
+                except queue.Empty:
+                    expiredIndexes = [index for index, (_, deadline) in pendingDeadlines.items() if deadline <= time.time()]
+                    for index in expiredIndexes:
+                        url, _ = pendingDeadlines.pop(index)
+                        logging.warning('Webpage %s did not return within %ss of its timeout', url, self.taskTimeoutGraceSeconds)
+                        yield url, None, 'Timed out after {}s'.format(self.taskTimeoutSeconds)
+                    continue
+                if pendingDeadlines.pop(index, None) is not None:
+                    yield result
+        finally:
+            if remainingUrls:
+                logging.info('Batch webpage request stopped early, skipping %d urls', len(remainingUrls))
+
+
+def _make_error_response(message, status):
+    return Response(json.dumps({'error': message}), status=status, mimetype='application/json')
+
+
+def register_batch_webpage_endpoint(application, jwtAuthorizer, requestJwtHolder, batchWebpageProcessor):
+
+    def process_webpages_batch():
+        authorizationHeader = request.headers.get('Authorization', '')
+        if not authorizationHeader.startswith('Bearer '):
+            return _make_error_response(message='Missing bearer token', status=401)
+        requestJwt = authorizationHeader[len('Bearer '):]
+        jwtAuthorizer.verify_jwt(jwt=requestJwt)
+        requestJwtHolder.set_value(value=requestJwt)
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return _make_error_response(message='Body must be a JSON object', status=400)
+        urls = payload.get('urls')
+        if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            return _make_error_response(message='urls must be a list of strings', status=400)
+        try:
+            results = batchWebpageProcessor.process_webpages(urls=urls)
+        except ValueError as exception:
+            return _make_error_response(message=str(exception), status=400)
+
+        def stream_results():
+            try:
+                for url, webpage, error in results:
+                    yield json.dumps({'url': url, 'webpage': webpage, 'error': error}) + '\n'
+            finally:
+                results.close()
+        return Response(stream_results(), mimetype='application/x-ndjson')
+
+    application.add_url_rule('/v0/webpages/batch', 'process_webpages_batch', process_webpages_batch, methods=['POST'])
@@ -7,7 +7,6 @@ from broom import BroomClient
 from carbon.api import CarbonFlask
 from carbon.api import JwtRefreshingHealthApiProvider
 from carbon.api import SwaggerApiProvider
-from carbon.authorization import JwtAuthorizer
 from carbon.logging import logging_formatter
 
 
@@ -17,9 +16,20 @@ from chad.api.v0 import ChadApiV0
 
 from carbon.api import StupidImport
 
+from service_common.jwt_caching import CachingJwtAuthorizer
+from service_common.startup import run_after_fork
+
+from batch_webpage_processing import BatchWebpageProcessor
+from batch_webpage_processing import register_batch_webpage_endpoint
+
 DATA_PARSER_LANGUAGES = ['en', 'ar']
 
 
+def make_webpage_processor(requestIdHolder, serviceJwtHolder):
+    requester = Requester(requestIdHolder=requestIdHolder, requestJwtHolder=serviceJwtHolder)
+    return WebpageProcessor(requester=requester, htmlTidyClient=BroomClient(requester=requester), dateParserLanguages=DATA_PARSER_LANGUAGES)
+
+
 def make_app(name, debug, serverName, version, requestIdHolder, sessionIdHolder):
     serviceJwtHolder = SettableValueHolder(value=None)
     requester = Requester(requestIdHolder=requestIdHolder, requestJwtHolder=serviceJwtHolder)
@@ -29,7 +39,7 @@ def make_app(name, debug, serverName, version, requestIdHolder, sessionIdHolder)
     broomClient = BroomClient(requester=requester)
     webpageProcessor = WebpageProcessor(requester=requester, htmlTidyClient=broomClient, dateParserLanguages=DATA_PARSER_LANGUAGES)
 
-    jwtAuthorizer = JwtAuthorizer(jwtRefreshingClient=GuardianRefreshingClient(requester=Requester(requestIdHolder=requestIdHolder)))
+    jwtAuthorizer = CachingJwtAuthorizer(jwtRefreshingClient=GuardianRefreshingClient(requester=Requester(requestIdHolder=requestIdHolder)))
     requestJwtHolder = SettableValueHolder(value=None)
     chadApiV0 = ChadApiV0(requestIdHolder=requestIdHolder, requestJwtHolder=requestJwtHolder, jwtAuthorizer=jwtAuthorizer, sessionIdHolder=sessionIdHolder, webpageProcessor=webpageProcessor)
 
@@ -38,6 +48,9 @@ def make_app(name, debug, serverName, version, requestIdHolder, sessionIdHolder)
     swaggerApiProvider = SwaggerApiProvider(requestIdHolder=requestIdHolder, sessionIdHolder=sessionIdHolder)
     carbonApiProviders = [healthApiProvider, swaggerApiProvider, chadApiV0]
     application.register_providers(carbonApiProviders=carbonApiProviders)
+    batchWebpageProcessor = BatchWebpageProcessor(requestIdHolder=requestIdHolder, serviceJwtHolder=serviceJwtHolder, webpageProcessorFactory=make_webpage_processor)
+    run_after_fork(function=batchWebpageProcessor.start)
+    register_batch_webpage_endpoint(application=application, jwtAuthorizer=jwtAuthorizer, requestJwtHolder=requestJwtHolder, batchWebpageProcessor=batchWebpageProcessor)
     return application
 
 
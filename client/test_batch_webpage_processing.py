@@ -0,0 +1,105 @@
+import json
+import os
+import time
+import unittest
+
+from carbon.util import SettableValueHolder
+from flask import Flask
+from google.protobuf.wrappers_pb2 import StringValue
+
+from batch_webpage_processing import BatchWebpageProcessor
+from batch_webpage_processing import register_batch_webpage_endpoint
+
+
+class FakeWebpageProcessor:
+
+    def __init__(self, requestIdHolder, serviceJwtHolder):
+        self.requestIdHolder = requestIdHolder
+        self.serviceJwtHolder = serviceJwtHolder
+
+    def process_webpage(self, url):
+        if url.startswith('sleep:'):
+            time.sleep(float(url[len('sleep:'):]))
+        if url == 'error':
+            raise ValueError('Unparseable webpage')
+        return StringValue(value='{} {} {} {}'.format(url, self.requestIdHolder.get_value(), self.serviceJwtHolder.get_value(), os.getpid()))
+
+
+class FakeJwtAuthorizer:
+
+    def __init__(self):
+        self.verifiedJwts = []
+
+    def verify_jwt(self, jwt):
+        if jwt == 'invalid':
+            raise PermissionError('Invalid token')
+        self.verifiedJwts.append(jwt)
+        return jwt
+
+
+class BatchWebpageProcessorTestCase(unittest.TestCase):
+
+    def _make_processor(self, **kwargs):
+        processor = BatchWebpageProcessor(requestIdHolder=SettableValueHolder(value='request-id'), serviceJwtHolder=SettableValueHolder(value='service-jwt'), webpageProcessorFactory=FakeWebpageProcessor, **kwargs)
+        processor.start()
+        self.addCleanup(processor.close)
+        return processor
+
+    def test_streams_results_in_completion_order(self):
+        processor = self._make_processor(processCount=2)
+        results = list(processor.process_webpages(urls=['sleep:0.5', 'fast', 'error']))
+        self.assertEqual([url for url, _, _ in results], ['fast', 'error', 'sleep:0.5'])
+        self.assertEqual(results[0][1].split()[:3], ['fast', 'request-id', 'service-jwt'])
+        self.assertEqual(results[1], ('error', None, 'Unparseable webpage'))
+
+    def test_timed_out_webpages_are_cancelled_in_the_pool_process(self):
+        processor = self._make_processor(processCount=1, taskTimeoutSeconds=0.2)
+        results = list(processor.process_webpages(urls=['sleep:5', 'fast']))
+        self.assertEqual(results[0], ('sleep:5', None, 'Timed out after 0.2s'))
+        self.assertEqual(results[1][0], 'fast')
+
+    def test_rejects_batches_over_the_limit(self):
+        processor = self._make_processor(processCount=1, maxBatchSize=1)
+        with self.assertRaises(ValueError):
+            processor.process_webpages(urls=['a', 'b'])
+
+
+class BatchWebpageEndpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = BatchWebpageProcessor(requestIdHolder=SettableValueHolder(value='request-id'), serviceJwtHolder=SettableValueHolder(value='service-jwt'), webpageProcessorFactory=FakeWebpageProcessor, processCount=1, maxBatchSize=2)
+        self.processor.start()
+        self.addCleanup(self.processor.close)
+        self.jwtAuthorizer = FakeJwtAuthorizer()
+        self.requestJwtHolder = SettableValueHolder(value=None)
+        application = Flask(__name__)
+        application.testing = True
+        register_batch_webpage_endpoint(application=application, jwtAuthorizer=self.jwtAuthorizer, requestJwtHolder=self.requestJwtHolder, batchWebpageProcessor=self.processor)
+        self.testClient = application.test_client()
+
+    def _post(self, body, token='request-jwt'):
+        headers = {'Authorization': 'Bearer {}'.format(token)} if token else {}
+        return self.testClient.post('/v0/webpages/batch', data=json.dumps(body), content_type='application/json', headers=headers)
+
+    def test_streams_one_json_line_per_url(self):
+        response = self._post(body={'urls': ['a', 'error']})
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(sorted(line['url'] for line in lines), ['a', 'error'])
+        self.assertEqual(self.jwtAuthorizer.verifiedJwts, ['request-jwt'])
+        self.assertEqual(self.requestJwtHolder.get_value(), 'request-jwt')
+
+    def test_requires_a_bearer_token(self):
+        self.assertEqual(self._post(body={'urls': ['a']}, token=None).status_code, 401)
+
+    def test_authorizer_errors_are_left_to_the_application(self):
+        with self.assertRaises(PermissionError):
+            self._post(body={'urls': ['a']}, token='invalid')
+
+    def test_rejects_invalid_bodies(self):
+        for body in (['a'], 'a', None, {'urls': 'a'}, {'urls': [1]}, {'urls': ['a', 'b', 'c']}):
+            self.assertEqual(self._post(body=body).status_code, 400, body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,18 @@
+import hmac
+import os
+
+import boto3
 from carbon.api import CarbonFlask
 from carbon.api import JwtRefreshingHealthApiProvider
 from carbon.api import SwaggerApiProvider
-from carbon.authorization import JwtAuthorizer
-from carbon.caching import DictCache
 from carbon.logging import logging_formatter
 from carbon.messages.message_queues import SqsMessageQueue
 from carbon.requesters import Requester
 from carbon.storage import S3StorageClient
 from carbon.util import SettableValueHolder
 from carbon.util import http_util
+from flask import g
+from flask import request
 from frank import FrankClient
 from guardian import GuardianClient
 from guardian_refreshing import GuardianRefreshingClient
@@ -24,7 +28,6 @@ from penguin.store import ArticleMetadataRetriever
 from penguin.store import ArticleSaver
 from penguin.store import ArticleSourcesRetriever
 from penguin.store import ArticleContentRetriever
-from penguin.store import RawArticleStore
 from penguin.store import connections
 from penguin.store.redis_database import ImageUrlStore
 from penguin.store.redis_database import PreCalculatedImageUrlStore
@@ -34,37 +37,77 @@ from penguin.api.v1 import PenguinApiV1
 from penguin.api.v2 import PenguinApiV2
 from frank import UnusedImport
 
+from service_common.database_pooling import DatabaseConnectionPool
+from service_common.database_pooling import ThreadLocalDatabaseConnection
+from service_common.jwt_caching import CachingJwtAuthorizer
+from service_common.response_caching import LruCache
+from service_common.response_caching import RedisTtlCache
+from service_common.raw_article_storage import make_raw_article_store
+from service_common.search_indexing import BufferedSearchIndexClient
+from service_common.startup import DependencyContainer
+from service_common.startup import LazyValueHolder
+from service_common.startup import run_after_fork
+from service_common.tracing import InstrumentedClient
+from service_common.tracing import Tracer
+
+REQUEST_CACHE_MAX_BYTES = int(os.environ.get('REQUEST_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+REQUEST_CACHE_TTL_SECONDS = 60 * 5
+REQUEST_CACHE_TTL_SECONDS_BY_CLIENT = {
+    'babel': 60 * 60 * 24,
+    'frank': 60 * 60,
+    'journo': 0,
+    'lingo': 60 * 60 * 24,
+    'pam': 0,
+    'stitch': 60 * 60,
+    'worm': 0,
+}
+RAW_ARTICLE_BUCKET_NAME = os.environ.get('RAW_ARTICLE_BUCKET_NAME')
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+METRICS_BEARER_TOKEN = os.environ.get('METRICS_BEARER_TOKEN')
+
 
 def make_app(name, debug, serverName, version, requestIdHolder, sessionIdHolder):
-    dictCache = DictCache()
-    serviceJwtHolder = SettableValueHolder(value=None)
-    requester = Requester(requestIdHolder=requestIdHolder, requestJwtHolder=serviceJwtHolder, caches=[dictCache])
-    guardianClient = GuardianClient(requester=requester)
-    serviceJwt = guardianClient.login_with_password(userId=constants.SERVICE_ID, password=constants.SERVICE_PASSWORD, maxTokenAge=60 * 60)
-    serviceJwtHolder.set_value(value=serviceJwt)
-
-    databaseConnection = connections.get_database()
-    redisConnection = connections.get_redis_connection()
-    storageClient = S3StorageClient()
+    tracer = Tracer(requestIdHolder=requestIdHolder)
+    container = DependencyContainer()
+    guardianClient = GuardianClient(requester=Requester(requestIdHolder=requestIdHolder))
+    container.register(name='serviceJwt', factory=guardianClient.login_with_password, userId=constants.SERVICE_ID, password=constants.SERVICE_PASSWORD, maxTokenAge=60 * 60)
+    serviceJwtHolder = LazyValueHolder(container=container, name='serviceJwt')
+
+    def make_database_connection_pool():
+        return DatabaseConnectionPool(connectionFactory=connections.get_database, size=DATABASE_POOL_SIZE, initialConnections=[connections.get_database()])
+    databaseConnectionPool = container.register(name='databaseConnectionPool', factory=make_database_connection_pool)
+    redisConnection = container.register(name='redisConnection', factory=connections.get_redis_connection)
+    storageClient = container.register(name='storageClient', factory=S3StorageClient)
+    s3Client = container.register(name='s3Client', factory=boto3.client, service_name='s3')
+
+    databaseConnection = ThreadLocalDatabaseConnection(connectionPool=databaseConnectionPool)
+    requestCacheMaxTtlSeconds = max([REQUEST_CACHE_TTL_SECONDS] + list(REQUEST_CACHE_TTL_SECONDS_BY_CLIENT.values()))
+    requestCache = LruCache(maxBytes=REQUEST_CACHE_MAX_BYTES, ttlSeconds=requestCacheMaxTtlSeconds)
+    requestRedisCache = RedisTtlCache(redisConnection=redisConnection, keyPrefix='{}-requests'.format(constants.SERVER_BASE_NAME), ttlSeconds=requestCacheMaxTtlSeconds)
+
+    def make_requester(clientName):
+        ttlSeconds = REQUEST_CACHE_TTL_SECONDS_BY_CLIENT.get(clientName, REQUEST_CACHE_TTL_SECONDS)
+        return Requester(requestIdHolder=requestIdHolder, requestJwtHolder=serviceJwtHolder, caches=[requestCache.with_ttl(ttlSeconds=ttlSeconds), requestRedisCache.with_ttl(ttlSeconds=ttlSeconds)])
     imageUrlStore = ImageUrlStore(keyPrefix=constants.SERVER_BASE_NAME)
     preCalculatedImageUrlStore = PreCalculatedImageUrlStore(keyPrefix=constants.SERVER_BASE_NAME)
 
-    rawWebpageStore = RawArticleStore(storageClient=storageClient, mimetype=http_util.MIMETYPE_HTML)
-    rawAqmStore = RawArticleStore(storageClient=storageClient, mimetype=http_util.MIMETYPE_JSON)
+    rawWebpageStore = make_raw_article_store(storageClient=storageClient, mimetype=http_util.MIMETYPE_HTML, bucketName=RAW_ARTICLE_BUCKET_NAME, s3Client=s3Client)
+    rawAqmStore = make_raw_article_store(storageClient=storageClient, mimetype=http_util.MIMETYPE_JSON, bucketName=RAW_ARTICLE_BUCKET_NAME, s3Client=s3Client)
     articleContentRetriever = ArticleContentRetriever()
     articleMetadataRetriever = ArticleMetadataRetriever()
     articleSourceRetriever = ArticleSourcesRetriever()
-    wormClient = WormClient(requester=requester)
-    stitchClient = StitchClient(requester=requester)
-    frankClient = FrankClient(requester=requester)
-    lingoClient = LingoClient(requester=requester)
+    wormClient = InstrumentedClient(client=WormClient(requester=make_requester(clientName='worm')), name='worm', tracer=tracer)
+    articleSearchIndexClient = container.register(name='articleSearchIndexClient', factory=BufferedSearchIndexClient, searchIndexClient=wormClient, redisConnection=redisConnection, keyPrefix=constants.SERVER_BASE_NAME)
+    stitchClient = InstrumentedClient(client=StitchClient(requester=make_requester(clientName='stitch')), name='stitch', tracer=tracer)
+    frankClient = InstrumentedClient(client=FrankClient(requester=make_requester(clientName='frank')), name='frank', tracer=tracer)
+    lingoClient = InstrumentedClient(client=LingoClient(requester=make_requester(clientName='lingo')), name='lingo', tracer=tracer)
     articleSaver = ArticleSaver()
-    articleManager = ArticleManager(databaseConnection=databaseConnection, rawWebpageStore=rawWebpageStore, rawAqmStore=rawAqmStore, articleMetadataRetriever=articleMetadataRetriever, articleContentRetriever=articleContentRetriever, articleSaver=articleSaver, articleTaggingClient=stitchClient, imageUrlStore=imageUrlStore, preCalculatedImageUrlStore=preCalculatedImageUrlStore, frankClient=frankClient, articleSourceRetriever=articleSourceRetriever, redisConnection=redisConnection, articleSearchIndexClient=wormClient, languageClient=lingoClient)
+    articleManager = InstrumentedClient(client=ArticleManager(databaseConnection=databaseConnection, rawWebpageStore=rawWebpageStore, rawAqmStore=rawAqmStore, articleMetadataRetriever=articleMetadataRetriever, articleContentRetriever=articleContentRetriever, articleSaver=articleSaver, articleTaggingClient=stitchClient, imageUrlStore=imageUrlStore, preCalculatedImageUrlStore=preCalculatedImageUrlStore, frankClient=frankClient, articleSourceRetriever=articleSourceRetriever, redisConnection=redisConnection, articleSearchIndexClient=articleSearchIndexClient, languageClient=lingoClient), name='article_manager', tracer=tracer)
 
     penguinQueue = SqsMessageQueue(requestIdHolder=requestIdHolder, region=constants.QUEUE_REGION_ARTICLE_PROCESSING, name=constants.QUEUE_NAME_ARTICLE_PROCESSING, messageDelay=constants.MAX_REPLICA_LAG)
 
     requestJwtHolder = SettableValueHolder(value=None)
-    jwtAuthorizer = JwtAuthorizer(jwtRefreshingClient=GuardianRefreshingClient(requester=Requester(requestIdHolder=requestIdHolder)))
+    jwtAuthorizer = CachingJwtAuthorizer(jwtRefreshingClient=GuardianRefreshingClient(requester=Requester(requestIdHolder=requestIdHolder)))
     penguinApiV0 = PenguinApiV0(requestIdHolder=requestIdHolder, requestJwtHolder=requestJwtHolder, jwtAuthorizer=jwtAuthorizer, sessionIdHolder=sessionIdHolder, penguinQueue=penguinQueue, articleManager=articleManager)
     penguinApiV1 = PenguinApiV1(requestIdHolder=requestIdHolder, requestJwtHolder=requestJwtHolder, jwtAuthorizer=jwtAuthorizer, sessionIdHolder=sessionIdHolder, penguinQueue=penguinQueue, articleManager=articleManager)
     penguinApiV2 = PenguinApiV2(requestIdHolder=requestIdHolder, requestJwtHolder=requestJwtHolder, jwtAuthorizer=jwtAuthorizer, sessionIdHolder=sessionIdHolder, penguinQueue=penguinQueue, articleManager=articleManager)
@@ -77,6 +120,24 @@ def make_app(name, debug, serverName, version, requestIdHolder, sessionIdHolder)
     carbonApiProviders = [healthApiProvider, swaggerApiProvider, penguinApiV0, penguinApiV1, penguinApiV2, penguinApiV3, penguinApiV4]
     application.register_providers(carbonApiProviders=carbonApiProviders)
 
+    def begin_request_span():
+        g.requestSpan = tracer.begin_span(name='request.{}'.format(request.endpoint), isRoot=True)
+
+    def finish_request(exception):
+        requestSpan = g.pop('requestSpan', None)
+        if requestSpan is not None:
+            tracer.finish_span(span=requestSpan, isError=exception is not None)
+        databaseConnection.release_connection()
+    application.before_request(begin_request_span)
+    application.teardown_request(finish_request)
+
+    def render_metrics():
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), 'Bearer {}'.format(METRICS_BEARER_TOKEN).encode('utf-8')):
+            return 'Unauthorized', 401, {'WWW-Authenticate': 'Bearer'}
+        return tracer.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+    if METRICS_BEARER_TOKEN:
+        application.add_url_rule('/metrics', 'metrics', render_metrics)
+    run_after_fork(function=lambda: container.start(names=['serviceJwt', 'databaseConnectionPool', 'redisConnection', 'storageClient', 'articleSearchIndexClient']))
     return application
 
 
@@ -1,7 +1,6 @@
 from carbon.api import CarbonFlask
 from carbon.api import JwtRefreshingHealthApiProvider
 from carbon.api import SwaggerApiProvider
-from carbon.authorization import JwtAuthorizer
 from carbon.logging import logging_formatter
 from carbon.requesters import Requester
 from carbon.util import SettableValueHolder
@@ -27,17 +26,22 @@ from inception.store import connections
 
 from inception.store import Nothing
 
+from service_common.jwt_caching import CachingJwtAuthorizer
+from service_common.startup import DependencyContainer
+from service_common.startup import LazyValueHolder
+from service_common.startup import run_after_fork
+
 
 def make_app(name, debug, serverName, version, requestIdHolder, sessionIdHolder):
-    serviceJwtHolder = SettableValueHolder(value=None)
+    container = DependencyContainer()
+    guardianClient = GuardianClient(requester=Requester(requestIdHolder=requestIdHolder))
+    container.register(name='serviceJwt', factory=guardianClient.login_with_password, userId=constants.SERVICE_ID, password=constants.SERVICE_PASSWORD, maxTokenAge=60 * 60)
+    serviceJwtHolder = LazyValueHolder(container=container, name='serviceJwt')
     requester = Requester(requestIdHolder=requestIdHolder, requestJwtHolder=serviceJwtHolder)
-    guardianClient = GuardianClient(requester=requester)
-    serviceJwt = guardianClient.login_with_password(userId=constants.SERVICE_ID, password=constants.SERVICE_PASSWORD, maxTokenAge=60 * 60)
-    serviceJwtHolder.set_value(value=serviceJwt)
+    databaseConnection = container.register(name='databaseConnection', factory=connections.get_database)
 
     requestJwtHolder = SettableValueHolder(value=None)
-    jwtAuthorizer = JwtAuthorizer(jwtRefreshingClient=GuardianRefreshingClient(requester=Requester(requestIdHolder=requestIdHolder)))
-    databaseConnection = connections.get_database()
+    jwtAuthorizer = CachingJwtAuthorizer(jwtRefreshingClient=GuardianRefreshingClient(requester=Requester(requestIdHolder=requestIdHolder)))
     userClient = RegisterClient(requester=requester)
     serviceRetriever = ServiceRetriever()
     serviceSaver = ServiceSaver()
@@ -55,6 +59,7 @@ def make_app(name, debug, serverName, version, requestIdHolder, sessionIdHolder)
     application = CarbonFlask(importName=name, debug=debug, serverName=serverName, version=version)
 
     application.register_providers(carbonApiProviders=[inceptionApiV0, inceptionApiV1, healthApiProvider, swaggerApiProvider], disableTimeLimits=debug)
+    run_after_fork(function=lambda: container.start(names=['serviceJwt', 'databaseConnection']))
     return application
 
 
@@ -0,0 +1,119 @@
+import logging
+import queue
+import threading
+
+
+def is_connection_open(connection):
+    isClosed = getattr(connection, 'is_closed', None)
+    return not isClosed() if callable(isClosed) else True
+
+
+def ping_connection(connection):
+    if not is_connection_open(connection=connection):
+        return False
+    executeSql = getattr(connection, 'execute_sql', None)
+    if callable(executeSql):
+        executeSql('SELECT 1')
+        return True
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    finally:
+        cursor.close()
+    return True
+
+
+def rollback_connection(connection):
+    rollback = getattr(connection, 'rollback', None)
+    if callable(rollback):
+        rollback()
+
+
+class DatabaseConnectionPool:
+
+    def __init__(self, connectionFactory, size, initialConnections=None, healthCheck=ping_connection, resetConnection=rollback_connection, acquireTimeoutSeconds=30):
+        if size <= 0:
+            raise ValueError('size must be positive')
+        self.connectionFactory = connectionFactory
+        self.size = size
+        self.healthCheck = healthCheck
+        self.resetConnection = resetConnection
+        self.acquireTimeoutSeconds = acquireTimeoutSeconds
+        self.idleConnections = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(value=size)
+        for connection in (initialConnections or [])[:size]:
+            self.idleConnections.put(connection)
+
+    def _is_healthy(self, connection):
+        try:
+            return self.healthCheck(connection)
+        except Exception:  # pylint: disable=broad-except
+            logging.warning('Database connection health check failed', exc_info=True)
+            return False
+
+    @staticmethod
+    def _discard(connection):
+        close = getattr(connection, 'close', None)
+        if not callable(close):
+            return
+        try:
+            close()
+        except Exception:  # pylint: disable=broad-except
+            logging.debug('Failed to close a discarded database connection', exc_info=True)
+
+    def acquire(self):
+        if not self.slots.acquire(timeout=self.acquireTimeoutSeconds):
+            raise TimeoutError('Timed out waiting for a database connection')
+        try:
+            while True:
+                try:
+                    connection = self.idleConnections.get_nowait()
+                except queue.Empty:
+                    return self.connectionFactory()
+                if self._is_healthy(connection=connection):
+                    return connection
+                logging.info('Discarding unhealthy database connection')
+                self._discard(connection=connection)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, connection):
+        try:
+            self.resetConnection(connection)
+        except Exception:  # pylint: disable=broad-except
+            logging.warning('Failed to roll back a released database connection, discarding it', exc_info=True)
+            self._discard(connection=connection)
+        else:
+            self.idleConnections.put(connection)
+        finally:
+            self.slots.release()
+
+
+class ThreadLocalDatabaseConnection:
+
+    def __init__(self, connectionPool):
+        self.connectionPool = connectionPool
+        self.threadLocal = threading.local()
+
+    def get_connection(self):
+        connection = getattr(self.threadLocal, 'connection', None)
+        if connection is None:
+            connection = self.connectionPool.acquire()
+            self.threadLocal.connection = connection
+        return connection
+
+    def release_connection(self):
+        connection = getattr(self.threadLocal, 'connection', None)
+        if connection is not None:
+            self.threadLocal.connection = None
+            self.connectionPool.release(connection=connection)
+
+    def __getattr__(self, name):
+        return getattr(self.get_connection(), name)
+
+    def __enter__(self):
+        return self.get_connection().__enter__()
+
+    def __exit__(self, excType, excValue, traceback):
+        return self.get_connection().__exit__(excType, excValue, traceback)
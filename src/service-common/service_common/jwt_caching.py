@@ -0,0 +1,35 @@
+import base64
+import hashlib
+import json
+import time
+
+from carbon.authorization import JwtAuthorizer
+
+from service_common.response_caching import LruCache
+
+
+def get_jwt_expiry_time(jwt):
+    try:
+        payload = jwt.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)).decode('utf-8'))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class CachingJwtAuthorizer(JwtAuthorizer):
+
+    def __init__(self, jwtRefreshingClient, maxBytes=16 * 1024 * 1024, maxTtlSeconds=60 * 5):
+        super().__init__(jwtRefreshingClient=jwtRefreshingClient)
+        self.verifiedJwtCache = LruCache(maxBytes=maxBytes, ttlSeconds=maxTtlSeconds)
+
+    def verify_jwt(self, jwt):
+        cacheKey = hashlib.sha256(jwt.encode('utf-8')).hexdigest()
+        cachedResult = self.verifiedJwtCache.get(key=cacheKey)
+        if cachedResult is not None:
+            return cachedResult[0]
+        verifiedJwt = super().verify_jwt(jwt=jwt)
+        expiryTime = get_jwt_expiry_time(jwt=jwt)
+        if expiryTime is not None and expiryTime > time.time():
+            self.verifiedJwtCache.set(key=cacheKey, value=(verifiedJwt,), expirySeconds=expiryTime - time.time())
+        return verifiedJwt
@@ -0,0 +1,73 @@
+import gzip
+import hashlib
+
+from botocore.exceptions import ClientError
+
+from penguin.store import RawArticleStore
+
+CONTENT_ENCODING_GZIP = 'gzip'
+CONTENT_HASH_METADATA_KEY = 'content-hash'
+CONTENT_KIND_METADATA_KEY = 'content-kind'
+CONTENT_KIND_BYTES = 'bytes'
+CONTENT_KIND_TEXT = 'text'
+
+
+def _is_not_found_error(error):
+    return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+class CompressedRawArticleStore(RawArticleStore):
+
+    def __init__(self, storageClient, mimetype, bucketName, s3Client, keyPrefix='raw-articles', compressionLevel=6):
+        super().__init__(storageClient=storageClient, mimetype=mimetype)
+        self.mimetype = mimetype
+        self.bucketName = bucketName
+        self.s3Client = s3Client
+        self.keyPrefix = keyPrefix
+        self.compressionLevel = compressionLevel
+
+    def _get_key(self, articleId):
+        return '{}/{}/{}'.format(self.keyPrefix, self.mimetype, articleId)
+
+    def _get_stored_metadata(self, key):
+        try:
+            storedObject = self.s3Client.head_object(Bucket=self.bucketName, Key=key)
+        except ClientError as error:
+            if _is_not_found_error(error=error):
+                return None
+            raise
+        return storedObject.get('Metadata', {})
+
+    def save_raw_article(self, articleId, content):
+        contentKind = CONTENT_KIND_TEXT if isinstance(content, str) else CONTENT_KIND_BYTES
+        if contentKind == CONTENT_KIND_TEXT:
+            content = content.encode('utf-8')
+        key = self._get_key(articleId=articleId)
+        metadata = {CONTENT_HASH_METADATA_KEY: hashlib.sha256(content).hexdigest(), CONTENT_KIND_METADATA_KEY: contentKind}
+        if self._get_stored_metadata(key=key) == metadata:
+            return metadata[CONTENT_HASH_METADATA_KEY]
+        self.s3Client.put_object(Bucket=self.bucketName, Key=key, Body=gzip.compress(content, compresslevel=self.compressionLevel), ContentType=self.mimetype, ContentEncoding=CONTENT_ENCODING_GZIP, Metadata=metadata)
+        return metadata[CONTENT_HASH_METADATA_KEY]
+
+    def _get_legacy_raw_article(self, articleId):
+        return super().get_raw_article(articleId=articleId)
+
+    def get_raw_article(self, articleId):
+        try:
+            storedObject = self.s3Client.get_object(Bucket=self.bucketName, Key=self._get_key(articleId=articleId))
+        except ClientError as error:
+            if _is_not_found_error(error=error):
+                return self._get_legacy_raw_article(articleId=articleId)
+            raise
+        content = storedObject['Body'].read()
+        if storedObject.get('ContentEncoding') == CONTENT_ENCODING_GZIP:
+            content = gzip.decompress(content)
+        if storedObject.get('Metadata', {}).get(CONTENT_KIND_METADATA_KEY) == CONTENT_KIND_BYTES:
+            return content
+        return content.decode('utf-8')
+
+
+def make_raw_article_store(storageClient, mimetype, bucketName=None, s3Client=None):
+    if not bucketName:
+        return RawArticleStore(storageClient=storageClient, mimetype=mimetype)
+    return CompressedRawArticleStore(storageClient=storageClient, mimetype=mimetype, bucketName=bucketName, s3Client=s3Client)
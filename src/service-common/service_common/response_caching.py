@@ -0,0 +1,157 @@
+import base64
+import collections
+import json
+import logging
+import pickle
+import sys
+import threading
+import time
+
+
+def get_size_bytes(value):
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:  # pylint: disable=broad-except
+        return sys.getsizeof(value)
+
+
+class TtlCacheView:
+
+    def __init__(self, cache, ttlSeconds):
+        self.cache = cache
+        self.ttlSeconds = ttlSeconds
+
+    def get(self, key):
+        if not self.ttlSeconds:
+            return None
+        return self.cache.get(key=key)
+
+    def set(self, key, value, expirySeconds=None):
+        if not self.ttlSeconds:
+            return
+        self.cache.set(key=key, value=value, expirySeconds=self.ttlSeconds if expirySeconds is None else min(self.ttlSeconds, expirySeconds))
+
+    def delete(self, key):
+        self.cache.delete(key=key)
+
+
+class LruCache:
+
+    def __init__(self, maxBytes, ttlSeconds):
+        if maxBytes <= 0:
+            raise ValueError('maxBytes must be positive')
+        self.maxBytes = maxBytes
+        self.ttlSeconds = ttlSeconds
+        self.entries = collections.OrderedDict()
+        self.sizeBytes = 0
+        self.lock = threading.Lock()
+        self.hitCount = 0
+        self.missCount = 0
+        self.evictionCount = 0
+        self.expiryCount = 0
+
+    def with_ttl(self, ttlSeconds):
+        return TtlCacheView(cache=self, ttlSeconds=ttlSeconds)
+
+    def _remove(self, key):
+        _, _, entrySizeBytes = self.entries.pop(key)
+        self.sizeBytes -= entrySizeBytes
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.missCount += 1
+                return None
+            value, expiryTime, _ = entry
+            if expiryTime < time.time():
+                self._remove(key=key)
+                self.expiryCount += 1
+                self.missCount += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hitCount += 1
+            return value
+
+    def set(self, key, value, expirySeconds=None):
+        ttlSeconds = self.ttlSeconds if expirySeconds is None else min(self.ttlSeconds, expirySeconds)
+        entrySizeBytes = get_size_bytes(value=key) + get_size_bytes(value=value)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key=key)
+            if entrySizeBytes > self.maxBytes:
+                return
+            self.entries[key] = (value, time.time() + ttlSeconds, entrySizeBytes)
+            self.sizeBytes += entrySizeBytes
+            while self.sizeBytes > self.maxBytes:
+                self._remove(key=next(iter(self.entries)))
+                self.evictionCount += 1
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key=key)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'bytes': self.sizeBytes,
+                'hits': self.hitCount,
+                'misses': self.missCount,
+                'evictions': self.evictionCount,
+                'expiries': self.expiryCount,
+            }
+
+
+class RedisTtlCache:
+
+    def __init__(self, redisConnection, keyPrefix, ttlSeconds):
+        self.redisConnection = redisConnection
+        self.keyPrefix = keyPrefix
+        self.ttlSeconds = ttlSeconds
+
+    def with_ttl(self, ttlSeconds):
+        return TtlCacheView(cache=self, ttlSeconds=ttlSeconds)
+
+    def _get_key(self, key):
+        return '{}:{}'.format(self.keyPrefix, key)
+
+    def get(self, key):
+        try:
+            serializedValue = self.redisConnection.get(self._get_key(key=key))
+            if serializedValue is None:
+                return None
+            envelope = json.loads(serializedValue)
+            if envelope.get('isBytes'):
+                return base64.b64decode(envelope['value'])
+            return envelope['value']
+        except Exception:  # pylint: disable=broad-except
+            logging.warning('Failed to read %s from the redis cache, treating it as a miss', key, exc_info=True)
+            return None
+
+    def set(self, key, value, expirySeconds=None):
+        ttlSeconds = self.ttlSeconds if expirySeconds is None else min(self.ttlSeconds, expirySeconds)
+        if ttlSeconds <= 0:
+            return
+        if isinstance(value, bytes):
+            envelope = {'isBytes': True, 'value': base64.b64encode(value).decode('ascii')}
+        else:
+            envelope = {'value': value}
+        try:
+            serializedValue = json.dumps(envelope)
+        except (TypeError, ValueError):
+            logging.debug('Not caching a value of type %s in redis, it is not JSON serializable', type(value).__name__)
+            return
+        try:
+            self.redisConnection.set(self._get_key(key=key), serializedValue, ex=max(1, int(ttlSeconds)))
+        except Exception:  # pylint: disable=broad-except
+            logging.warning('Failed to write %s to the redis cache', key, exc_info=True)
+
+    def delete(self, key):
+        try:
+            self.redisConnection.delete(self._get_key(key=key))
+        except Exception:  # pylint: disable=broad-except
+            logging.warning('Failed to delete %s from the redis cache', key, exc_info=True)
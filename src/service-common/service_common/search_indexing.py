@@ -0,0 +1,211 @@
+import functools
+import importlib
+import inspect
+import json
+import logging
+import numbers
+import threading
+import time
+
+from google.protobuf import json_format
+from google.protobuf.message import Message
+
+OPERATION_INDEX = 'index'
+OPERATION_DELETE = 'delete'
+ARGUMENT_TYPE_JSON = 'json'
+ARGUMENT_TYPE_PROTOBUF = 'protobuf'
+
+
+class SearchIndexBufferFullError(Exception):
+    pass
+
+
+def _is_json_value(value):
+    if value is None or isinstance(value, (str, bool, numbers.Integral, float)):
+        return True
+    if isinstance(value, list):
+        return all(_is_json_value(item) for item in value)
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _is_json_value(item) for key, item in value.items())
+    return False
+
+
+def encode_argument(value):
+    if _is_json_value(value):
+        return {'type': ARGUMENT_TYPE_JSON, 'value': value}
+    if isinstance(value, Message):
+        messageType = '{}:{}'.format(type(value).__module__, type(value).__qualname__)
+        return {'type': ARGUMENT_TYPE_PROTOBUF, 'messageType': messageType, 'value': json_format.MessageToDict(value)}
+    return None
+
+
+def decode_argument(encodedArgument):
+    if encodedArgument['type'] == ARGUMENT_TYPE_PROTOBUF:
+        moduleName, className = encodedArgument['messageType'].split(':')
+        messageClass = functools.reduce(getattr, className.split('.'), importlib.import_module(moduleName))
+        return json_format.ParseDict(encodedArgument['value'], messageClass())
+    return encodedArgument['value']
+
+
+class BufferedSearchIndexClient:
+
+    def __init__(self, searchIndexClient, redisConnection, keyPrefix, indexMethodName='index_article', deleteMethodName='delete_article', documentIdArgumentName='articleId', bulkIndexMethodName=None, bulkDeleteMethodName=None, flushSize=100, flushIntervalSeconds=5, maxBufferSize=10000, backpressureTimeoutSeconds=2, lockTimeoutSeconds=60, maxAttempts=5):
+        self.searchIndexClient = searchIndexClient
+        self.redisConnection = redisConnection
+        self.pendingKey = '{}:search-index-buffer'.format(keyPrefix)
+        self.processingKey = '{}:search-index-buffer:processing'.format(keyPrefix)
+        self.lockKey = '{}:search-index-buffer:lock'.format(keyPrefix)
+        self.methodNames = {OPERATION_INDEX: indexMethodName, OPERATION_DELETE: deleteMethodName}
+        self.methodSignatures = {operation: self._get_method_signature(methodName=methodName, documentIdArgumentName=documentIdArgumentName) for operation, methodName in self.methodNames.items()}
+        self.bulkMethodNames = {operation: methodName for operation, methodName in ((OPERATION_INDEX, bulkIndexMethodName), (OPERATION_DELETE, bulkDeleteMethodName)) if methodName is not None}
+        for methodName in self.bulkMethodNames.values():
+            if not callable(getattr(self.searchIndexClient, methodName, None)):
+                raise ValueError('searchIndexClient has no method {}'.format(methodName))
+        self.documentIdArgumentName = documentIdArgumentName
+        self.flushSize = flushSize
+        self.flushIntervalSeconds = flushIntervalSeconds
+        self.maxBufferSize = maxBufferSize
+        self.backpressureTimeoutSeconds = backpressureTimeoutSeconds
+        self.lockTimeoutSeconds = lockTimeoutSeconds
+        self.maxAttempts = maxAttempts
+        self.flushEvent = threading.Event()
+        self.flushThread = threading.Thread(target=self._run_flush_loop, name='search-index-flush', daemon=True)
+        self.flushThread.start()
+
+    def _get_method_signature(self, methodName, documentIdArgumentName):
+        method = getattr(self.searchIndexClient, methodName, None)
+        if not callable(method):
+            raise ValueError('searchIndexClient has no method {}'.format(methodName))
+        signature = inspect.signature(method)
+        acceptsKeywords = any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in signature.parameters.values())
+        if documentIdArgumentName not in signature.parameters and not acceptsKeywords:
+            raise ValueError('{} does not take a {} argument'.format(methodName, documentIdArgumentName))
+        return signature
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        for operation, methodName in self.methodNames.items():
+            if name == methodName:
+                return lambda *args, **kwargs: self._buffer_operation(operation=operation, args=args, kwargs=kwargs)
+        return getattr(self.searchIndexClient, name)
+
+    def _get_keyword_arguments(self, operation, args, kwargs):
+        signature = self.methodSignatures[operation]
+        arguments = {}
+        for name, value in signature.bind(*args, **kwargs).arguments.items():
+            kind = signature.parameters[name].kind
+            if kind == inspect.Parameter.VAR_KEYWORD:
+                arguments.update(value)
+            elif kind == inspect.Parameter.VAR_POSITIONAL:
+                raise TypeError('{} cannot be buffered with extra positional arguments'.format(self.methodNames[operation]))
+            else:
+                arguments[name] = value
+        if self.documentIdArgumentName not in arguments:
+            raise TypeError('{} requires {}'.format(self.methodNames[operation], self.documentIdArgumentName))
+        return arguments
+
+    @staticmethod
+    def _serialize_operation(operation, encodedArguments, attemptCount=0):
+        return json.dumps({'operation': operation, 'arguments': encodedArguments, 'attemptCount': attemptCount}, sort_keys=True)
+
+    def _buffer_operation(self, operation, args, kwargs):
+        arguments = self._get_keyword_arguments(operation=operation, args=args, kwargs=kwargs)
+        documentId = str(arguments[self.documentIdArgumentName])
+        encodedArguments = {name: encode_argument(value=value) for name, value in arguments.items()}
+        if any(encodedArgument is None for encodedArgument in encodedArguments.values()):
+            self.redisConnection.hdel(self.pendingKey, documentId)
+            self.redisConnection.hdel(self.processingKey, documentId)
+            return getattr(self.searchIndexClient, self.methodNames[operation])(**arguments)
+        serializedOperation = self._serialize_operation(operation=operation, encodedArguments=encodedArguments)
+        self._wait_for_buffer_space()
+        self.redisConnection.hset(self.pendingKey, documentId, serializedOperation)
+        if self.redisConnection.hlen(self.pendingKey) >= self.flushSize:
+            self.flushEvent.set()
+        return None
+
+    def _wait_for_buffer_space(self):
+        deadline = time.time() + self.backpressureTimeoutSeconds
+        while self.redisConnection.hlen(self.pendingKey) >= self.maxBufferSize:
+            self.flushEvent.set()
+            if time.time() >= deadline:
+                raise SearchIndexBufferFullError('Search index buffer still holds {} or more operations after {}s'.format(self.maxBufferSize, self.backpressureTimeoutSeconds))
+            time.sleep(0.05)
+
+    def _run_flush_loop(self):
+        while True:
+            self.flushEvent.wait(self.flushIntervalSeconds)
+            self.flushEvent.clear()
+            try:
+                self.flush()
+                if self.redisConnection.exists(self.processingKey):
+                    self.flushEvent.set()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('Failed to flush the search index buffer, operations will be retried')
+
+    @staticmethod
+    def _decode_arguments(operation):
+        return {name: decode_argument(encodedArgument=encodedArgument) for name, encodedArgument in operation['arguments'].items()}
+
+    def _apply_operation(self, operation):
+        getattr(self.searchIndexClient, self.methodNames[operation['operation']])(**self._decode_arguments(operation=operation))
+
+    def _apply_bulk_operations(self, operationName, operations):
+        getattr(self.searchIndexClient, self.bulkMethodNames[operationName])([self._decode_arguments(operation=operation) for operation in operations.values()])
+
+    def _retry_operation(self, documentId, operation):
+        attemptCount = operation.get('attemptCount', 0) + 1
+        if attemptCount >= self.maxAttempts:
+            logging.error('Dropping the search index operation for document %s after %d failed attempts', documentId, attemptCount)
+            return
+        self.redisConnection.hsetnx(self.pendingKey, documentId, self._serialize_operation(operation=operation['operation'], encodedArguments=operation['arguments'], attemptCount=attemptCount))
+
+    def _claim_batch(self):
+        if not self.redisConnection.exists(self.processingKey):
+            if not self.redisConnection.exists(self.pendingKey):
+                return {}
+            self.redisConnection.rename(self.pendingKey, self.processingKey)
+        batch = {}
+        for documentId, serializedOperation in self.redisConnection.hscan_iter(self.processingKey, count=self.flushSize):
+            batch[documentId] = serializedOperation
+            if len(batch) >= self.flushSize:
+                break
+        return batch
+
+    def _apply_batch(self, batch, deadline):
+        operationsByName = {}
+        for documentId, serializedOperation in batch.items():
+            operation = json.loads(serializedOperation)
+            operationsByName.setdefault(operation['operation'], {})[documentId] = operation
+        appliedCount = 0
+        for operationName, operations in operationsByName.items():
+            if operationName in self.bulkMethodNames and time.time() < deadline:
+                try:
+                    self._apply_bulk_operations(operationName=operationName, operations=operations)
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception('Failed to apply %d search index operations in bulk, applying them one by one', len(operations))
+                else:
+                    for documentId in operations:
+                        self.redisConnection.hdel(self.processingKey, documentId)
+                    appliedCount += len(operations)
+                    continue
+            for documentId, operation in operations.items():
+                if time.time() >= deadline:
+                    return appliedCount
+                try:
+                    self._apply_operation(operation=operation)
+                    appliedCount += 1
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception('Failed to apply the search index operation for document %s', documentId)
+                    self._retry_operation(documentId=documentId, operation=operation)
+                self.redisConnection.hdel(self.processingKey, documentId)
+        return appliedCount
+
+    def flush(self):
+        lock = self.redisConnection.lock(self.lockKey, timeout=self.lockTimeoutSeconds)
+        if not lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._apply_batch(batch=self._claim_batch(), deadline=time.time() + self.lockTimeoutSeconds / 2.0)
+        finally:
+            lock.release()
@@ -0,0 +1,131 @@
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import wait
+
+from carbon.util import SettableValueHolder
+
+
+class LazyDependency:
+
+    def __init__(self, container, name):
+        self._container = container
+        self._name = name
+
+    def __getattr__(self, attributeName):
+        if attributeName.startswith('__'):
+            raise AttributeError(attributeName)
+        return getattr(self._container.get(name=self._name), attributeName)
+
+    def __enter__(self):
+        return self._container.get(name=self._name).__enter__()
+
+    def __exit__(self, excType, excValue, traceback):
+        return self._container.get(name=self._name).__exit__(excType, excValue, traceback)
+
+
+class LazyValueHolder(SettableValueHolder):
+
+    def __init__(self, container, name):
+        super().__init__(value=None)
+        self.container = container
+        self.name = name
+        self.isValueSet = False
+
+    def get_value(self):
+        if not self.isValueSet:
+            self.set_value(value=self.container.get(name=self.name))
+        return super().get_value()
+
+    def set_value(self, value):
+        super().set_value(value=value)
+        self.isValueSet = True
+
+
+class DependencyContainer:
+
+    def __init__(self):
+        self.factories = {}
+        self.futures = {}
+        self.durations = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def register(self, name, factory, **kwargs):
+        if name in self.factories:
+            raise ValueError('Dependency {} is already registered'.format(name))
+        self.factories[name] = (factory, kwargs)
+        return LazyDependency(container=self, name=name)
+
+    def lazy(self, name):
+        if name not in self.factories:
+            raise KeyError(name)
+        return LazyDependency(container=self, name=name)
+
+    def _claim_future(self, name):
+        if name not in self.factories:
+            raise KeyError(name)
+        with self.lock:
+            future = self.futures.get(name)
+            if future is not None:
+                return future, False
+            future = Future()
+            self.futures[name] = future
+            return future, True
+
+    def _build(self, name, future):
+        factory, kwargs = self.factories[name]
+        startTime = time.time()
+        try:
+            value = factory(**{key: self.get(name=value._name) if isinstance(value, LazyDependency) else value for key, value in kwargs.items()})  # pylint: disable=protected-access
+        except BaseException as exception:
+            with self.lock:
+                self.durations[name] = time.time() - startTime
+                del self.futures[name]
+            logging.exception('Failed to build dependency %s', name)
+            future.set_exception(exception)
+        else:
+            with self.lock:
+                self.durations[name] = time.time() - startTime
+            future.set_result(value)
+
+    def get(self, name):
+        future, isClaimed = self._claim_future(name=name)
+        if isClaimed:
+            self._build(name=name, future=future)
+        return future.result()
+
+    def start(self, names):
+        startTime = time.time()
+        futures = []
+        for name in names:
+            future, isClaimed = self._claim_future(name=name)
+            if isClaimed:
+                threading.Thread(target=self._build, kwargs={'name': name, 'future': future}, name='startup-{}'.format(name), daemon=True).start()
+            futures.append(future)
+        threading.Thread(target=self._log_durations_when_done, kwargs={'futures': futures, 'startTime': startTime}, name='startup-timing', daemon=True).start()
+        return futures
+
+    def _log_durations_when_done(self, futures, startTime):
+        wait(futures)
+        with self.lock:
+            durationsString = ', '.join('{}={:.3f}s'.format(name, duration) for name, duration in self.durations.items())
+        logging.info('Startup dependencies ready in %.3fs (%s)', time.time() - startTime, durationsString)
+
+    def get_durations(self):
+        with self.lock:
+            return dict(self.durations)
+
+
+def run_after_fork(function):
+    try:
+        import uwsgi  # pylint: disable=import-error
+        import uwsgidecorators  # pylint: disable=import-error
+    except ImportError:
+        function()
+        return
+    if uwsgi.worker_id() > 0:
+        function()
+        return
+    uwsgidecorators.postfork(function)
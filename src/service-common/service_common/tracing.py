@@ -0,0 +1,209 @@
+import bisect
+import collections
+import contextlib
+import functools
+import heapq
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class LatencyHistogram:
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucketCounts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.errorCount = 0
+        self.totalSeconds = 0.0
+
+    def record(self, durationSeconds, isError):
+        self.bucketCounts[bisect.bisect_left(self.buckets, durationSeconds)] += 1
+        self.count += 1
+        self.totalSeconds += durationSeconds
+        if isError:
+            self.errorCount += 1
+
+    def get_quantile(self, quantile):
+        if not self.count:
+            return None
+        targetCount = quantile * self.count
+        previousCumulativeCount = 0
+        for bucketIndex, bucketCount in enumerate(self.bucketCounts):
+            cumulativeCount = previousCumulativeCount + bucketCount
+            if bucketCount and cumulativeCount >= targetCount:
+                if bucketIndex == len(self.buckets):
+                    return self.buckets[-1]
+                lowerBound = self.buckets[bucketIndex - 1] if bucketIndex else 0.0
+                upperBound = self.buckets[bucketIndex]
+                return lowerBound + (upperBound - lowerBound) * (targetCount - previousCumulativeCount) / bucketCount
+            previousCumulativeCount = cumulativeCount
+        return self.buckets[-1]
+
+
+class Span:
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.startTime = time.time()
+        self.durationSeconds = None
+        self.isError = False
+        self.isRoot = False
+        self.profiler = None
+        self.tags = {}
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'durationSeconds': self.durationSeconds,
+            'isError': self.isError,
+            'tags': self.tags,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+class SamplingProfiler:
+
+    def __init__(self, threadId, intervalSeconds):
+        self.threadId = threadId
+        self.intervalSeconds = intervalSeconds
+        self.stackCounts = collections.Counter()
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        while not self.stopEvent.wait(self.intervalSeconds):
+            frame = sys._current_frames().get(self.threadId)  # pylint: disable=protected-access
+            stack = []
+            while frame is not None:
+                stack.append('{}:{}'.format(frame.f_code.co_filename, frame.f_code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stackCounts[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        self.thread.join()
+        return self.stackCounts.most_common(20)
+
+
+class Tracer:
+
+    def __init__(self, requestIdHolder, slowestTraceCount=10, profilingIntervalSeconds=None):
+        self.requestIdHolder = requestIdHolder
+        self.slowestTraceCount = slowestTraceCount
+        self.profilingIntervalSeconds = profilingIntervalSeconds
+        self.histograms = collections.defaultdict(LatencyHistogram)
+        self.slowestTraces = []
+        self.traceCounter = itertools.count()
+        self.lock = threading.Lock()
+        self.threadLocal = threading.local()
+
+    def begin_span(self, name, isRoot=False):
+        parent = getattr(self.threadLocal, 'currentSpan', None)
+        span = Span(name=name, parent=parent)
+        span.isRoot = isRoot and parent is None
+        if parent is not None:
+            parent.children.append(span)
+        elif span.isRoot:
+            span.tags['requestId'] = self.requestIdHolder.get_value()
+            if self.profilingIntervalSeconds:
+                span.profiler = SamplingProfiler(threadId=threading.get_ident(), intervalSeconds=self.profilingIntervalSeconds)
+                span.profiler.start()
+        self.threadLocal.currentSpan = span
+        return span
+
+    def finish_span(self, span, isError=False):
+        span.isError = span.isError or isError
+        span.durationSeconds = time.time() - span.startTime
+        self.threadLocal.currentSpan = span.parent
+        with self.lock:
+            self.histograms[span.name].record(durationSeconds=span.durationSeconds, isError=span.isError)
+        if span.isRoot:
+            if span.tags['requestId'] is None:
+                span.tags['requestId'] = self.requestIdHolder.get_value()
+            if span.profiler is not None:
+                span.tags['profile'] = span.profiler.stop()
+            self._record_trace(span=span)
+
+    @contextlib.contextmanager
+    def span(self, name, isRoot=False):
+        span = self.begin_span(name=name, isRoot=isRoot)
+        try:
+            yield span
+        except Exception:
+            span.isError = True
+            raise
+        finally:
+            self.finish_span(span=span)
+
+    def _record_trace(self, span):
+        with self.lock:
+            entry = (span.durationSeconds, next(self.traceCounter), span)
+            if len(self.slowestTraces) < self.slowestTraceCount:
+                heapq.heappush(self.slowestTraces, entry)
+            else:
+                heapq.heappushpop(self.slowestTraces, entry)
+
+    def get_stats(self, shouldResetSlowestTraces=False):
+        with self.lock:
+            slowestTraces = sorted(self.slowestTraces, reverse=True)
+            if shouldResetSlowestTraces:
+                self.slowestTraces = []
+            return {
+                'stages': {name: {'count': histogram.count, 'errors': histogram.errorCount, 'totalSeconds': histogram.totalSeconds, 'p50': histogram.get_quantile(quantile=0.5), 'p99': histogram.get_quantile(quantile=0.99)} for name, histogram in self.histograms.items()},
+                'slowestTraces': [span.to_dict() for _, _, span in slowestTraces],
+            }
+
+    def render_prometheus(self):
+        lines = []
+        pid = os.getpid()
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                for bucket, cumulativeCount in zip(histogram.buckets, itertools.accumulate(histogram.bucketCounts)):
+                    lines.append('stage_latency_seconds_bucket{{stage="{}",pid="{}",le="{}"}} {}'.format(name, pid, bucket, cumulativeCount))
+                lines.append('stage_latency_seconds_bucket{{stage="{}",pid="{}",le="+Inf"}} {}'.format(name, pid, histogram.count))
+                lines.append('stage_latency_seconds_sum{{stage="{}",pid="{}"}} {}'.format(name, pid, histogram.totalSeconds))
+                lines.append('stage_latency_seconds_count{{stage="{}",pid="{}"}} {}'.format(name, pid, histogram.count))
+                lines.append('stage_errors_total{{stage="{}",pid="{}"}} {}'.format(name, pid, histogram.errorCount))
+        return '\n'.join(lines) + '\n'
+
+    def start_stats_logging(self, intervalSeconds):
+        def log_stats():
+            while True:
+                time.sleep(intervalSeconds)
+                logging.info('Stage stats: %s', self.get_stats(shouldResetSlowestTraces=True))
+        thread = threading.Thread(target=log_stats, name='tracer-stats-logging', daemon=True)
+        thread.start()
+        return thread
+
+
+class InstrumentedClient:
+
+    def __init__(self, client, name, tracer, isRoot=False):
+        self._client = client
+        self._name = name
+        self._tracer = tracer
+        self._isRoot = isRoot
+
+    def __getattr__(self, attributeName):
+        attribute = getattr(self._client, attributeName)
+        if attributeName.startswith('_') or not callable(attribute):
+            return attribute
+        spanName = '{}.{}'.format(self._name, attributeName)
+
+        @functools.wraps(attribute)
+        def instrumented(*args, **kwargs):
+            with self._tracer.span(name=spanName, isRoot=self._isRoot):
+                return attribute(*args, **kwargs)
+        return instrumented
@@ -0,0 +1,7 @@
+from setuptools import setup
+
+setup(
+    name='service-common',
+    version='0.1.0',
+    packages=['service_common'],
+)
@@ -0,0 +1,102 @@
+import threading
+import unittest
+
+from service_common.database_pooling import DatabaseConnectionPool
+from service_common.database_pooling import ThreadLocalDatabaseConnection
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.isClosed = False
+        self.isServerGone = False
+        self.isRollbackFailing = False
+        self.executedQueries = []
+        self.rollbackCount = 0
+
+    def is_closed(self):
+        return self.isClosed
+
+    def execute_sql(self, query):
+        if self.isServerGone:
+            raise ConnectionError('server closed the connection unexpectedly')
+        self.executedQueries.append(query)
+
+    def rollback(self):
+        if self.isRollbackFailing:
+            raise ConnectionError('server closed the connection unexpectedly')
+        self.rollbackCount += 1
+
+    def close(self):
+        self.isClosed = True
+
+
+class ThreadLocalDatabaseConnectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.createdConnections = []
+        self.connectionPool = DatabaseConnectionPool(connectionFactory=self._create_connection, size=2, acquireTimeoutSeconds=0.1)
+        self.databaseConnection = ThreadLocalDatabaseConnection(connectionPool=self.connectionPool)
+
+    def _create_connection(self):
+        connection = FakeConnection()
+        self.createdConnections.append(connection)
+        return connection
+
+    def _run_unit_of_work(self):
+        try:
+            return self.databaseConnection.get_connection()
+        finally:
+            self.databaseConnection.release_connection()
+
+    def test_sequential_threads_do_not_exhaust_the_pool(self):
+        errors = []
+
+        def run():
+            try:
+                self._run_unit_of_work()
+            except Exception as exception:  # pylint: disable=broad-except
+                errors.append(exception)
+        for _ in range(3):
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.createdConnections), 1)
+
+    def test_reuses_a_connection_within_a_unit_of_work(self):
+        try:
+            self.assertIs(self.databaseConnection.get_connection(), self.databaseConnection.get_connection())
+        finally:
+            self.databaseConnection.release_connection()
+
+    def test_replaces_a_closed_connection_on_the_next_unit_of_work(self):
+        connection = self._run_unit_of_work()
+        connection.isClosed = True
+        self.assertIsNot(self._run_unit_of_work(), connection)
+        self.assertEqual(len(self.createdConnections), 2)
+
+    def test_pings_idle_connections_and_replaces_dropped_ones(self):
+        connection = self._run_unit_of_work()
+        self.assertIs(self._run_unit_of_work(), connection)
+        self.assertEqual(connection.executedQueries, ['SELECT 1'])
+        connection.isServerGone = True
+        self.assertIsNot(self._run_unit_of_work(), connection)
+        self.assertTrue(connection.isClosed)
+
+    def test_rolls_back_connections_when_they_are_released(self):
+        connection = self._run_unit_of_work()
+        self.assertEqual(connection.rollbackCount, 1)
+
+    def test_discards_connections_that_fail_to_roll_back(self):
+        connection = self.databaseConnection.get_connection()
+        connection.isRollbackFailing = True
+        self.databaseConnection.release_connection()
+        self.assertTrue(connection.isClosed)
+        self.assertIsNot(self._run_unit_of_work(), connection)
+        self._run_unit_of_work()
+        self._run_unit_of_work()
+
+
+if __name__ == '__main__':
+    unittest.main()
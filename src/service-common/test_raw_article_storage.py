@@ -0,0 +1,86 @@
+import io
+import unittest
+
+from botocore.exceptions import ClientError
+
+from service_common.raw_article_storage import CompressedRawArticleStore
+
+
+class InMemoryS3Client:
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def _get_object(self, Bucket, Key, operationName):  # pylint: disable=invalid-name
+        self.calls.append(operationName)
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey' if operationName == 'GetObject' else '404'}}, operationName)
+        return self.objects[(Bucket, Key)]
+
+    def head_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        storedObject = self._get_object(Bucket=Bucket, Key=Key, operationName='HeadObject')
+        return {'Metadata': storedObject['Metadata']}
+
+    def get_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        storedObject = self._get_object(Bucket=Bucket, Key=Key, operationName='GetObject')
+        return dict(storedObject, Body=io.BytesIO(storedObject['Body']))
+
+    def put_object(self, Bucket, Key, Body, ContentType, ContentEncoding, Metadata):  # pylint: disable=invalid-name
+        self.calls.append('PutObject')
+        self.objects[(Bucket, Key)] = {'Body': Body, 'ContentType': ContentType, 'ContentEncoding': ContentEncoding, 'Metadata': Metadata}
+
+
+class UnavailableS3Client:
+
+    def get_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        raise ClientError({'Error': {'Code': 'SlowDown'}}, 'GetObject')
+
+
+class LegacyFallbackRawArticleStore(CompressedRawArticleStore):
+
+    def _get_legacy_raw_article(self, articleId):
+        return 'legacy-{}'.format(articleId)
+
+
+def _make_store(s3Client):
+    return LegacyFallbackRawArticleStore(storageClient=None, mimetype='text/html', bucketName='raw-articles', s3Client=s3Client)
+
+
+class CompressedRawArticleStoreTestCase(unittest.TestCase):
+
+    def test_returns_text_for_text_and_bytes_for_bytes(self):
+        store = _make_store(s3Client=InMemoryS3Client())
+        store.save_raw_article(articleId='a', content='<html>café</html>')
+        store.save_raw_article(articleId='b', content=b'<html>caf\xe9</html>')
+        self.assertEqual(store.get_raw_article(articleId='a'), '<html>café</html>')
+        self.assertEqual(store.get_raw_article(articleId='b'), b'<html>caf\xe9</html>')
+
+    def test_stores_gzip_compressed_payloads(self):
+        s3Client = InMemoryS3Client()
+        store = _make_store(s3Client=s3Client)
+        store.save_raw_article(articleId='a', content='<html>' + 'x' * 1000 + '</html>')
+        storedObject = s3Client.objects[('raw-articles', 'raw-articles/text/html/a')]
+        self.assertEqual(storedObject['ContentEncoding'], 'gzip')
+        self.assertLess(len(storedObject['Body']), 100)
+
+    def test_skips_the_put_for_an_unchanged_payload(self):
+        s3Client = InMemoryS3Client()
+        store = _make_store(s3Client=s3Client)
+        store.save_raw_article(articleId='a', content='<html></html>')
+        store.save_raw_article(articleId='a', content='<html></html>')
+        store.save_raw_article(articleId='a', content=b'<html></html>')
+        self.assertEqual(s3Client.calls, ['HeadObject', 'PutObject', 'HeadObject', 'HeadObject', 'PutObject'])
+
+    def test_reads_articles_missing_from_the_bucket_through_the_legacy_store(self):
+        store = _make_store(s3Client=InMemoryS3Client())
+        self.assertEqual(store.get_raw_article(articleId='a'), 'legacy-a')
+
+    def test_raises_other_s3_errors(self):
+        store = _make_store(s3Client=UnavailableS3Client())
+        with self.assertRaises(ClientError):
+            store.get_raw_article(articleId='a')
+
+
+if __name__ == '__main__':
+    unittest.main()
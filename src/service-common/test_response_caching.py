@@ -0,0 +1,94 @@
+import unittest
+
+from service_common.response_caching import LruCache
+from service_common.response_caching import RedisTtlCache
+
+
+class FakeRedisConnection:
+
+    def __init__(self):
+        self.values = {}
+        self.expirySeconds = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.expirySeconds[key] = ex
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class UnavailableRedisConnection:
+
+    def get(self, key):
+        raise ConnectionError('redis is unavailable')
+
+    def set(self, key, value, ex=None):
+        raise ConnectionError('redis is unavailable')
+
+    def delete(self, key):
+        raise ConnectionError('redis is unavailable')
+
+
+class LruCacheTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used_entries_beyond_max_bytes(self):
+        cache = LruCache(maxBytes=25, ttlSeconds=60)
+        cache.set(key='a', value='x' * 9)
+        cache.set(key='b', value='x' * 9)
+        cache.get(key='a')
+        cache.set(key='c', value='x' * 9)
+        self.assertEqual(cache.get(key='a'), 'x' * 9)
+        self.assertIsNone(cache.get(key='b'))
+        self.assertEqual(cache.get_stats()['bytes'], 20)
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+
+    def test_skips_values_larger_than_max_bytes(self):
+        cache = LruCache(maxBytes=10, ttlSeconds=60)
+        cache.set(key='a', value='x' * 20)
+        self.assertIsNone(cache.get(key='a'))
+        self.assertEqual(cache.get_stats()['bytes'], 0)
+
+    def test_ttl_view_caps_expiry_and_zero_disables_caching(self):
+        cache = LruCache(maxBytes=100, ttlSeconds=60)
+        cache.with_ttl(ttlSeconds=-1).set(key='expired', value='x')
+        cache.with_ttl(ttlSeconds=0).set(key='disabled', value='x')
+        self.assertIsNone(cache.get(key='expired'))
+        self.assertIsNone(cache.get(key='disabled'))
+
+
+class RedisTtlCacheTestCase(unittest.TestCase):
+
+    def test_sets_values_with_expiry(self):
+        redisConnection = FakeRedisConnection()
+        cache = RedisTtlCache(redisConnection=redisConnection, keyPrefix='requests', ttlSeconds=300)
+        cache.with_ttl(ttlSeconds=60).set(key='a', value={'b': [1, 2]})
+        cache.set(key='c', value=b'\x00\xff')
+        self.assertEqual(cache.get(key='a'), {'b': [1, 2]})
+        self.assertEqual(cache.get(key='c'), b'\x00\xff')
+        self.assertEqual(redisConnection.expirySeconds, {'requests:a': 60, 'requests:c': 300})
+
+    def test_skips_values_that_are_not_json_serializable(self):
+        redisConnection = FakeRedisConnection()
+        cache = RedisTtlCache(redisConnection=redisConnection, keyPrefix='requests', ttlSeconds=300)
+        cache.set(key='a', value=object())
+        self.assertEqual(redisConnection.values, {})
+
+    def test_treats_redis_errors_as_misses(self):
+        cache = RedisTtlCache(redisConnection=UnavailableRedisConnection(), keyPrefix='requests', ttlSeconds=300)
+        cache.set(key='a', value='b')
+        cache.delete(key='a')
+        self.assertIsNone(cache.get(key='a'))
+
+    def test_treats_corrupt_values_as_misses(self):
+        redisConnection = FakeRedisConnection()
+        redisConnection.set('requests:a', '{not json')
+        cache = RedisTtlCache(redisConnection=redisConnection, keyPrefix='requests', ttlSeconds=300)
+        self.assertIsNone(cache.get(key='a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
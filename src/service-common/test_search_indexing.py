@@ -0,0 +1,213 @@
+import threading
+import unittest
+
+from google.protobuf.wrappers_pb2 import StringValue
+
+from service_common.search_indexing import BufferedSearchIndexClient
+from service_common.search_indexing import SearchIndexBufferFullError
+from service_common.search_indexing import encode_argument
+
+
+class FakeLock:
+
+    def __init__(self, redisConnection, name):
+        self.redisConnection = redisConnection
+        self.name = name
+
+    def acquire(self, blocking=True):  # pylint: disable=unused-argument
+        with self.redisConnection.mutex:
+            if self.name in self.redisConnection.heldLocks:
+                return False
+            self.redisConnection.heldLocks.add(self.name)
+            return True
+
+    def release(self):
+        with self.redisConnection.mutex:
+            self.redisConnection.heldLocks.remove(self.name)
+
+
+class FakeRedisConnection:
+
+    def __init__(self):
+        self.hashes = {}
+        self.heldLocks = set()
+        self.mutex = threading.Lock()
+
+    def hset(self, name, key, value):
+        self.hashes.setdefault(name, {})[key.encode('utf-8')] = value.encode('utf-8')
+
+    def hsetnx(self, name, key, value):
+        self.hashes.setdefault(name, {}).setdefault(key, value)
+
+    def hlen(self, name):
+        return len(self.hashes.get(name, {}))
+
+    def hdel(self, name, key):
+        self.hashes.get(name, {}).pop(key.encode('utf-8') if isinstance(key, str) else key, None)
+        if name in self.hashes and not self.hashes[name]:
+            del self.hashes[name]
+
+    def hscan_iter(self, name, count=None):  # pylint: disable=unused-argument
+        return iter(list(self.hashes.get(name, {}).items()))
+
+    def exists(self, name):
+        return int(bool(self.hashes.get(name)))
+
+    def rename(self, source, destination):
+        self.hashes[destination] = self.hashes.pop(source)
+
+    def lock(self, name, timeout=None):  # pylint: disable=unused-argument
+        return FakeLock(redisConnection=self, name=name)
+
+
+class ArticleModel:
+
+    def __init__(self, title):
+        self.title = title
+
+
+class FakeSearchIndexClient:
+
+    def __init__(self):
+        self.documents = {}
+        self.failingArticleIds = set()
+        self.bulkCalls = []
+        self.isBulkFailing = False
+
+    def index_article(self, articleId, title):
+        if articleId in self.failingArticleIds:
+            raise IOError('Search index is unavailable')
+        self.documents[articleId] = title
+
+    def index_articles(self, articles):
+        self.bulkCalls.append(articles)
+        if self.isBulkFailing:
+            raise IOError('Search index is unavailable')
+        for article in articles:
+            self.documents[article['articleId']] = article['title']
+
+    def delete_article(self, articleId):
+        self.documents.pop(articleId, None)
+
+    def search(self, query):
+        return [articleId for articleId, title in self.documents.items() if query in title]
+
+
+class BufferedSearchIndexClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redisConnection = FakeRedisConnection()
+        self.searchIndexClient = FakeSearchIndexClient()
+
+    def _make_client(self, **kwargs):
+        kwargs.setdefault('flushSize', 100)
+        return BufferedSearchIndexClient(searchIndexClient=self.searchIndexClient, redisConnection=self.redisConnection, keyPrefix='test', flushIntervalSeconds=3600, **kwargs)
+
+    def test_coalesces_operations_on_the_same_document(self):
+        client = self._make_client()
+        client.index_article(articleId='a', title='first')
+        client.index_article('a', title='second')
+        client.index_article(articleId='b', title='other')
+        self.assertEqual(self.searchIndexClient.documents, {})
+        self.assertEqual(client.flush(), 2)
+        self.assertEqual(self.searchIndexClient.documents, {'a': 'second', 'b': 'other'})
+
+    def test_delete_replaces_a_buffered_index_operation(self):
+        self.searchIndexClient.documents['a'] = 'stale'
+        client = self._make_client()
+        client.index_article(articleId='a', title='new')
+        client.delete_article(articleId='a')
+        client.flush()
+        self.assertEqual(self.searchIndexClient.documents, {})
+
+    def test_other_methods_pass_through(self):
+        self.searchIndexClient.documents['a'] = 'hello'
+        self.assertEqual(self._make_client().search(query='hell'), ['a'])
+
+    def test_rejects_clients_without_the_buffered_methods(self):
+        with self.assertRaises(ValueError):
+            self._make_client(deleteMethodName='remove_article')
+        with self.assertRaises(ValueError):
+            self._make_client(documentIdArgumentName='documentId')
+
+    def test_flushes_at_most_flush_size_operations(self):
+        client = self._make_client(flushSize=2)
+        for articleId in ('a', 'b', 'c'):
+            self.redisConnection.hset(client.pendingKey, articleId, client._serialize_operation(operation='index', encodedArguments={'articleId': encode_argument(value=articleId), 'title': encode_argument(value=articleId)}))  # pylint: disable=protected-access
+        self.assertEqual(client.flush(), 2)
+        self.assertEqual(len(self.searchIndexClient.documents), 2)
+        self.assertEqual(client.flush(), 1)
+        self.assertEqual(len(self.searchIndexClient.documents), 3)
+
+    def test_failed_operations_are_retried_unless_superseded(self):
+        client = self._make_client()
+        self.searchIndexClient.failingArticleIds = {'a', 'b'}
+        client.index_article(articleId='a', title='old')
+        client.index_article(articleId='b', title='retried')
+        client.flush()
+        client.index_article(articleId='a', title='new')
+        self.searchIndexClient.failingArticleIds = set()
+        client.flush()
+        self.assertEqual(self.searchIndexClient.documents, {'a': 'new', 'b': 'retried'})
+
+    def test_operations_are_dropped_after_max_attempts(self):
+        client = self._make_client(maxAttempts=2)
+        self.searchIndexClient.failingArticleIds = {'a'}
+        client.index_article(articleId='a', title='title')
+        client.flush()
+        self.assertEqual(self.redisConnection.hlen(client.pendingKey), 1)
+        client.flush()
+        self.assertEqual(self.redisConnection.hashes, {})
+
+    def test_protobuf_arguments_are_buffered(self):
+        client = self._make_client()
+        client.index_article(articleId='a', title=StringValue(value='title'))
+        self.assertEqual(self.searchIndexClient.documents, {})
+        client.flush()
+        self.assertEqual(self.searchIndexClient.documents, {'a': StringValue(value='title')})
+
+    def test_arguments_without_a_codec_are_applied_directly(self):
+        client = self._make_client()
+        client.index_article(articleId='a', title='buffered')
+        article = ArticleModel(title='direct')
+        client.index_article(articleId='a', title=article)
+        self.assertIs(self.searchIndexClient.documents['a'], article)
+        self.assertEqual(client.flush(), 0)
+        self.assertIs(self.searchIndexClient.documents['a'], article)
+
+    def test_flushes_through_the_bulk_method(self):
+        client = self._make_client(bulkIndexMethodName='index_articles')
+        client.index_article(articleId='a', title='first')
+        client.index_article(articleId='b', title='second')
+        client.delete_article(articleId='c')
+        self.assertEqual(client.flush(), 3)
+        self.assertEqual(sorted(article['articleId'] for article in self.searchIndexClient.bulkCalls[0]), ['a', 'b'])
+        self.assertEqual(self.searchIndexClient.documents, {'a': 'first', 'b': 'second'})
+
+    def test_failed_bulk_calls_fall_back_to_one_call_per_document(self):
+        client = self._make_client(bulkIndexMethodName='index_articles')
+        self.searchIndexClient.isBulkFailing = True
+        self.searchIndexClient.failingArticleIds = {'b'}
+        client.index_article(articleId='a', title='first')
+        client.index_article(articleId='b', title='second')
+        self.assertEqual(client.flush(), 1)
+        self.assertEqual(self.searchIndexClient.documents, {'a': 'first'})
+        self.assertEqual(self.redisConnection.hlen(client.pendingKey), 1)
+
+    def test_flush_is_skipped_while_another_flusher_holds_the_lock(self):
+        client = self._make_client()
+        client.index_article(articleId='a', title='title')
+        self.redisConnection.heldLocks.add(client.lockKey)
+        self.assertEqual(client.flush(), 0)
+        self.assertEqual(self.searchIndexClient.documents, {})
+
+    def test_rejects_operations_when_the_buffer_stays_full(self):
+        client = self._make_client(maxBufferSize=1, backpressureTimeoutSeconds=0)
+        self.redisConnection.heldLocks.add(client.lockKey)
+        client.index_article(articleId='a', title='title')
+        with self.assertRaises(SearchIndexBufferFullError):
+            client.index_article(articleId='b', title='title')
+
+
+if __name__ == '__main__':
+    unittest.main()
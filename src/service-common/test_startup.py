@@ -0,0 +1,64 @@
+import threading
+import unittest
+
+from service_common.startup import DependencyContainer
+from service_common.startup import LazyValueHolder
+from service_common.startup import run_after_fork
+
+
+class DependencyContainerTestCase(unittest.TestCase):
+
+    def test_start_builds_dependencies_in_parallel(self):
+        container = DependencyContainer()
+        barrier = threading.Barrier(parties=2, timeout=5)
+
+        def build(value):
+            barrier.wait()
+            return value
+        container.register(name='database', factory=build, value='database')
+        container.register(name='redis', factory=build, value='redis')
+        futures = container.start(names=['database', 'redis'])
+        self.assertEqual([future.result(timeout=5) for future in futures], ['database', 'redis'])
+        self.assertEqual(sorted(container.get_durations()), ['database', 'redis'])
+
+    def test_failed_build_is_retried_on_next_use(self):
+        container = DependencyContainer()
+        attempts = []
+
+        def login():
+            attempts.append(len(attempts))
+            if len(attempts) == 1:
+                raise ConnectionError('guardian is unavailable')
+            return 'service-jwt'
+        container.register(name='serviceJwt', factory=login)
+        serviceJwtHolder = LazyValueHolder(container=container, name='serviceJwt')
+        with self.assertRaises(ConnectionError):
+            serviceJwtHolder.get_value()
+        self.assertEqual(serviceJwtHolder.get_value(), 'service-jwt')
+        self.assertEqual(len(attempts), 2)
+
+    def test_dependency_is_built_with_the_dependencies_it_takes(self):
+        container = DependencyContainer()
+        builtNames = []
+
+        def make_redis_connection():
+            builtNames.append('redisConnection')
+            return {'host': 'redis'}
+
+        def make_search_index_client(redisConnection):
+            builtNames.append('searchIndexClient')
+            return ('searchIndexClient', redisConnection)
+        redisConnection = container.register(name='redisConnection', factory=make_redis_connection)
+        searchIndexClient = container.register(name='searchIndexClient', factory=make_search_index_client, redisConnection=redisConnection)
+        self.assertEqual(searchIndexClient.count('searchIndexClient'), 1)
+        self.assertEqual(container.get(name='searchIndexClient'), ('searchIndexClient', {'host': 'redis'}))
+        self.assertEqual(builtNames, ['redisConnection', 'searchIndexClient'])
+
+    def test_run_after_fork_runs_immediately_outside_uwsgi(self):
+        calls = []
+        run_after_fork(function=lambda: calls.append('started'))
+        self.assertEqual(calls, ['started'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import unittest
+
+from service_common.tracing import LatencyHistogram
+from service_common.tracing import Tracer
+
+
+class FakeValueHolder:
+
+    def __init__(self, value):
+        self.value = value
+
+    def get_value(self):
+        return self.value
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+
+    def test_interpolates_quantiles_within_a_bucket(self):
+        histogram = LatencyHistogram(buckets=(0.1, 0.2, 0.4))
+        for durationSeconds in (0.05, 0.15, 0.15, 0.3):
+            histogram.record(durationSeconds=durationSeconds, isError=False)
+        self.assertAlmostEqual(histogram.get_quantile(quantile=0.5), 0.15)
+        self.assertAlmostEqual(histogram.get_quantile(quantile=1.0), 0.4)
+
+    def test_overflow_bucket_reports_the_last_bound(self):
+        histogram = LatencyHistogram(buckets=(0.1,))
+        histogram.record(durationSeconds=5.0, isError=False)
+        self.assertEqual(histogram.get_quantile(quantile=0.99), 0.1)
+
+
+class TracerTestCase(unittest.TestCase):
+
+    def test_only_root_spans_are_recorded_as_traces(self):
+        tracer = Tracer(requestIdHolder=FakeValueHolder(value='request-id'))
+        with tracer.span(name='background.flush'):
+            pass
+        with tracer.span(name='message', isRoot=True):
+            with tracer.span(name='client.call'):
+                pass
+        stats = tracer.get_stats()
+        self.assertEqual([trace['name'] for trace in stats['slowestTraces']], ['message'])
+        self.assertEqual([child['name'] for child in stats['slowestTraces'][0]['children']], ['client.call'])
+        self.assertEqual(stats['slowestTraces'][0]['tags']['requestId'], 'request-id')
+        self.assertEqual(sorted(stats['stages']), ['background.flush', 'client.call', 'message'])
+
+    def test_resetting_slowest_traces_keeps_the_stage_histograms(self):
+        tracer = Tracer(requestIdHolder=FakeValueHolder(value='request-id'))
+        with tracer.span(name='message', isRoot=True):
+            pass
+        self.assertEqual(len(tracer.get_stats(shouldResetSlowestTraces=True)['slowestTraces']), 1)
+        stats = tracer.get_stats()
+        self.assertEqual(stats['slowestTraces'], [])
+        self.assertEqual(stats['stages']['message']['count'], 1)
+
+    def test_prometheus_series_are_labelled_with_the_process(self):
+        tracer = Tracer(requestIdHolder=FakeValueHolder(value='request-id'))
+        with tracer.span(name='message', isRoot=True):
+            pass
+        self.assertIn('stage_latency_seconds_count{{stage="message",pid="{}"}} 1'.format(os.getpid()), tracer.render_prometheus().splitlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
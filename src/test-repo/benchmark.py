@@ -0,0 +1,265 @@
+import argparse
+import base64
+import collections
+import io
+import json
+import random
+import resource
+import sys
+import threading
+import time
+import uuid
+from unittest import mock
+
+from botocore.exceptions import ClientError
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from penguin.store import connections
+
+from service_common.response_caching import LruCache
+from service_common.tracing import Tracer
+
+from message_queue_processing import ThreadLocalValueHolder
+from worker import make_worker
+
+MESSAGE_STAGE_NAME = 'article_queue_message_client.process_message'
+
+
+class InMemorySqsClient:
+
+    def __init__(self, messageBodies):
+        self.queuedMessages = collections.deque({'MessageId': str(index), 'ReceiptHandle': uuid.uuid4().hex, 'Body': body} for index, body in enumerate(messageBodies))
+        self.inFlightMessages = {}
+        self.deletedMessageCount = 0
+        self.callCounts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def get_queue_url(self, QueueName):  # pylint: disable=invalid-name
+        return {'QueueUrl': 'memory://{}'.format(QueueName)}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        with self.lock:
+            self.callCounts['receive_message'] += 1
+            messages = [self.queuedMessages.popleft() for _ in range(min(MaxNumberOfMessages, len(self.queuedMessages)))]
+            for message in messages:
+                self.inFlightMessages[message['ReceiptHandle']] = message
+        if not messages:
+            time.sleep(min(WaitTimeSeconds, 0.05))
+        return {'Messages': messages}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):  # pylint: disable=invalid-name,unused-argument
+        with self.lock:
+            self.callCounts['change_message_visibility_batch'] += 1
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+
+    def delete_message_batch(self, QueueUrl, Entries):  # pylint: disable=invalid-name,unused-argument
+        with self.lock:
+            self.callCounts['delete_message_batch'] += 1
+            for entry in Entries:
+                if self.inFlightMessages.pop(entry['ReceiptHandle'], None) is not None:
+                    self.deletedMessageCount += 1
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+
+
+class InMemoryS3Client:
+
+    def __init__(self):
+        self.objects = {}
+        self.callCounts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def _get_object(self, Bucket, Key, operationName):  # pylint: disable=invalid-name
+        with self.lock:
+            self.callCounts[operationName] += 1
+            storedObject = self.objects.get((Bucket, Key))
+        if storedObject is None:
+            raise ClientError({'Error': {'Code': 'NoSuchKey' if operationName == 'GetObject' else '404'}}, operationName)
+        return storedObject
+
+    def head_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        return {'Metadata': self._get_object(Bucket=Bucket, Key=Key, operationName='HeadObject')['Metadata']}
+
+    def get_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        storedObject = self._get_object(Bucket=Bucket, Key=Key, operationName='GetObject')
+        return dict(storedObject, Body=io.BytesIO(storedObject['Body']))
+
+    def put_object(self, Bucket, Key, Body, ContentType, ContentEncoding, Metadata):  # pylint: disable=invalid-name
+        with self.lock:
+            self.callCounts['PutObject'] += 1
+            self.objects[(Bucket, Key)] = {'Body': Body, 'ContentType': ContentType, 'ContentEncoding': ContentEncoding, 'Metadata': Metadata}
+
+
+class CountingDatabaseConnectionFactory:
+
+    def __init__(self, connectionFactory):
+        self.connectionFactory = connectionFactory
+        self.createdConnectionCount = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.createdConnectionCount += 1
+        return self.connectionFactory()
+
+
+class RecordedHttpResponses:
+
+    def __init__(self, recordings, latencyScale):
+        self.recordings = collections.defaultdict(list)
+        for recording in recordings:
+            self.recordings[(recording['method'], recording['url'])].append(recording)
+        self.latencyScale = latencyScale
+        self.replayCounts = collections.Counter()
+        self.unmatchedRequests = collections.Counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, latencyScale):
+        with open(path) as recordingsFile:
+            return cls(recordings=[json.loads(line) for line in recordingsFile if line.strip()], latencyScale=latencyScale)
+
+    def send(self, request, **kwargs):  # pylint: disable=unused-argument
+        key = (request.method, request.url)
+        with self.lock:
+            recordings = self.recordings.get(key)
+            if not recordings:
+                self.unmatchedRequests['{} {}'.format(*key)] += 1
+                recording = {'status': 404, 'headers': {}, 'body': '', 'elapsedSeconds': 0}
+            else:
+                recording = recordings[self.replayCounts[key] % len(recordings)]
+                self.replayCounts[key] += 1
+        time.sleep(recording['elapsedSeconds'] * self.latencyScale)
+        return _make_response(request=request, recording=recording)
+
+
+class HttpRecorder:
+
+    def __init__(self, path):
+        self.recordingsFile = open(path, 'a')
+        self.adapter = HTTPAdapter()
+        self.send = HTTPAdapter.send
+        self.lock = threading.Lock()
+
+    def record(self, request, **kwargs):
+        response = self.send(self.adapter, request, **kwargs)
+        recording = {'method': request.method, 'url': request.url, 'status': response.status_code, 'headers': dict(response.headers), 'body': base64.b64encode(response.content).decode('ascii'), 'elapsedSeconds': response.elapsed.total_seconds()}
+        with self.lock:
+            self.recordingsFile.write(json.dumps(recording) + '\n')
+            self.recordingsFile.flush()
+        return response
+
+
+def _make_response(request, recording):
+    response = Response()
+    response.status_code = recording['status']
+    response.headers = CaseInsensitiveDict(recording['headers'])
+    response._content = base64.b64decode(recording['body'])  # pylint: disable=protected-access
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = request.url
+    response.request = request
+    return response
+
+
+def _get_redis_command_count(redisConnection):
+    return sum(commandStats['calls'] for commandStats in redisConnection.info('commandstats').values())
+
+
+def _get_max_rss_bytes():
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRss if sys.platform == 'darwin' else maxRss * 1024
+
+
+def run_worker_benchmark(messageBodies, messageCount, concurrency, databasePoolSize):
+    sqsClient = InMemorySqsClient(messageBodies=[messageBodies[index % len(messageBodies)] for index in range(messageCount)])
+    s3Client = InMemoryS3Client()
+    redisConnection = connections.get_redis_connection()
+    databaseConnectionFactory = CountingDatabaseConnectionFactory(connectionFactory=connections.get_database)
+    requestIdHolder = ThreadLocalValueHolder(value=None)
+    tracer = Tracer(requestIdHolder=requestIdHolder)
+    startRedisCommandCount = _get_redis_command_count(redisConnection=redisConnection)
+    messageQueueProcessor = make_worker(requestIdHolder=requestIdHolder, concurrency=concurrency, databasePoolSize=databasePoolSize, tracer=tracer, sqsClient=sqsClient, redisConnection=redisConnection, databaseConnectionFactory=databaseConnectionFactory, s3Client=s3Client, rawArticleBucketName='benchmark-raw-articles')
+    processorThread = threading.Thread(target=messageQueueProcessor.run, name='benchmark-message-queue-processor')
+    startTime = time.time()
+    processorThread.start()
+    while processorThread.is_alive() and tracer.get_stats()['stages'].get(MESSAGE_STAGE_NAME, {}).get('count', 0) < messageCount:
+        time.sleep(0.01)
+    durationSeconds = time.time() - startTime
+    messageQueueProcessor.stop()
+    processorThread.join()
+    stages = tracer.get_stats()['stages']
+    messageStage = stages.get(MESSAGE_STAGE_NAME, {'count': 0, 'errors': 0, 'p50': None, 'p99': None})
+    return {
+        'concurrency': concurrency,
+        'databasePoolSize': databasePoolSize or concurrency,
+        'messageCount': messageCount,
+        'processedMessageCount': messageStage['count'],
+        'failedMessageCount': messageStage['errors'],
+        'deletedMessageCount': sqsClient.deletedMessageCount,
+        'durationSeconds': durationSeconds,
+        'messagesPerSecond': messageStage['count'] / durationSeconds,
+        'articleLatencyP50Seconds': messageStage['p50'],
+        'articleLatencyP99Seconds': messageStage['p99'],
+        'stages': {name: {'count': stage['count'], 'errors': stage['errors'], 'p50': stage['p50'], 'p99': stage['p99']} for name, stage in stages.items()},
+        'sqsCalls': dict(sqsClient.callCounts),
+        's3Calls': dict(s3Client.callCounts),
+        'redisCommands': _get_redis_command_count(redisConnection=redisConnection) - startRedisCommandCount,
+        'databaseConnectionsCreated': databaseConnectionFactory.createdConnectionCount,
+        'maxRssBytes': _get_max_rss_bytes(),
+    }
+
+
+def run_cache_benchmark(operationCount, keyCount, maxBytes, seed):
+    randomGenerator = random.Random(seed)
+    cache = LruCache(maxBytes=maxBytes, ttlSeconds=60)
+    keys = ['key-{}'.format(randomGenerator.randrange(keyCount)) for _ in range(operationCount)]
+    startTime = time.time()
+    for key in keys:
+        if cache.get(key=key) is None:
+            cache.set(key=key, value=key)
+    durationSeconds = time.time() - startTime
+    return dict(cache.get_stats(), operationsPerSecond=operationCount / durationSeconds, maxRssBytes=_get_max_rss_bytes())
+
+
+def _load_message_bodies(path):
+    with open(path) as messagesFile:
+        return [line.rstrip('\n') for line in messagesFile if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Throughput benchmark for the article worker. It builds the real make_worker graph against an in-memory SQS queue and S3 bucket, the local Redis and database that penguin is configured for, and downstream HTTP responses replayed from a recording. It does not measure the API.')
+    parser.add_argument('--messages-file', required=True, help='one SQS message body per line, as the API enqueues them')
+    parser.add_argument('--messages', type=int, default=200, help='messages per run, cycling through the messages file')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--database-pool-size', type=int, default=None, help='defaults to the concurrency, as in the worker')
+    parser.add_argument('--http-recording', required=True, help='JSON lines of recorded downstream responses')
+    parser.add_argument('--record', action='store_true', help='send downstream requests for real and append them to the recording instead of replaying it')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplies the recorded response times when replaying')
+    parser.add_argument('--cache-operations', type=int, default=200000)
+    parser.add_argument('--cache-keys', type=int, default=50000)
+    parser.add_argument('--cache-max-bytes', type=int, default=1024 * 1024)
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args(argv)
+    messageBodies = _load_message_bodies(path=arguments.messages_file)
+    if arguments.record:
+        httpTransport = HttpRecorder(path=arguments.http_recording).record
+    else:
+        recordedHttpResponses = RecordedHttpResponses.load(path=arguments.http_recording, latencyScale=arguments.latency_scale)
+        httpTransport = recordedHttpResponses.send
+    with mock.patch.object(HTTPAdapter, 'send', httpTransport):
+        workerResults = [run_worker_benchmark(messageBodies=messageBodies, messageCount=arguments.messages, concurrency=concurrency, databasePoolSize=arguments.database_pool_size) for concurrency in arguments.concurrency]
+    results = {
+        'timestamp': time.time(),
+        'worker': workerResults,
+        'requestCache': run_cache_benchmark(operationCount=arguments.cache_operations, keyCount=arguments.cache_keys, maxBytes=arguments.cache_max_bytes, seed=arguments.seed),
+    }
+    if not arguments.record:
+        results['unmatchedHttpRequests'] = dict(recordedHttpResponses.unmatchedRequests)
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
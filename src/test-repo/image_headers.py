@@ -0,0 +1,85 @@
+import struct
+
+JPEG_START_OF_FRAME_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9}
+JPEG_MARKER_HEADER_BYTE_COUNT = 9
+
+
+class IncompleteImageHeaderError(Exception):
+
+    def __init__(self, requiredByteCount):
+        super().__init__('The image header needs at least {} bytes'.format(requiredByteCount))
+        self.requiredByteCount = requiredByteCount
+
+
+def _require_byte_count(data, byteCount):
+    if len(data) < byteCount:
+        raise IncompleteImageHeaderError(requiredByteCount=byteCount)
+
+
+def _get_png_size(data):
+    _require_byte_count(data=data, byteCount=24)
+    if data[12:16] != b'IHDR':
+        return None
+    width, height = struct.unpack('>II', data[16:24])
+    return width, height
+
+
+def _get_gif_size(data):
+    _require_byte_count(data=data, byteCount=10)
+    width, height = struct.unpack('<HH', data[6:10])
+    return width, height
+
+
+def _get_webp_size(data):
+    _require_byte_count(data=data, byteCount=16)
+    chunkType = data[12:16]
+    if chunkType == b'VP8 ':
+        _require_byte_count(data=data, byteCount=30)
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunkType == b'VP8L':
+        _require_byte_count(data=data, byteCount=25)
+        bits = struct.unpack('<I', data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunkType == b'VP8X':
+        _require_byte_count(data=data, byteCount=30)
+        width = int.from_bytes(data[24:27], byteorder='little') + 1
+        height = int.from_bytes(data[27:30], byteorder='little') + 1
+        return width, height
+    return None
+
+
+def _get_jpeg_size(data):
+    offset = 2
+    while True:
+        if offset + 4 > len(data):
+            raise IncompleteImageHeaderError(requiredByteCount=offset + JPEG_MARKER_HEADER_BYTE_COUNT)
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in JPEG_START_OF_FRAME_MARKERS:
+            if offset + JPEG_MARKER_HEADER_BYTE_COUNT > len(data):
+                raise IncompleteImageHeaderError(requiredByteCount=offset + JPEG_MARKER_HEADER_BYTE_COUNT)
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        segmentLength = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        offset += 2 + segmentLength
+
+
+def get_image_size_from_header(data):
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return _get_png_size(data=data)
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return _get_gif_size(data=data)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return _get_webp_size(data=data)
+    if data.startswith(b'\xFF\xD8'):
+        return _get_jpeg_size(data=data)
+    return None
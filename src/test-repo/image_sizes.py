@@ -0,0 +1,64 @@
+import hashlib
+
+from penguin.internal import ImageSizeRetriever
+
+from image_headers import IncompleteImageHeaderError
+from image_headers import get_image_size_from_header
+
+UNREADABLE_HEADER_VALUE = b'unreadable'
+HTTP_STATUS_PARTIAL_CONTENT = 206
+
+
+class HeaderProbingImageSizeRetriever(ImageSizeRetriever):
+
+    def __init__(self, requester, redisConnection, keyPrefix, probeByteCount=8 * 1024, maxProbeByteCount=512 * 1024, cacheTtlSeconds=60 * 60 * 24 * 7, unreadableHeaderCacheTtlSeconds=60 * 60):
+        super().__init__(requester=requester)
+        self.requester = requester
+        self.redisConnection = redisConnection
+        self.keyPrefix = keyPrefix
+        self.probeByteCount = probeByteCount
+        self.maxProbeByteCount = maxProbeByteCount
+        self.cacheTtlSeconds = cacheTtlSeconds
+        self.unreadableHeaderCacheTtlSeconds = unreadableHeaderCacheTtlSeconds
+
+    def _get_cache_key(self, imageUrl):
+        return '{}:image-size:{}'.format(self.keyPrefix, hashlib.sha1(imageUrl.encode('utf-8')).hexdigest())
+
+    def _get_byte_range(self, imageUrl, startByte, endByte):
+        response = self.requester.get(url=imageUrl, headers={'Range': 'bytes={}-{}'.format(startByte, endByte)})
+        if response.status_code != HTTP_STATUS_PARTIAL_CONTENT:
+            return response.content[startByte:], False
+        return response.content, len(response.content) == endByte + 1 - startByte
+
+    def _probe_image_size(self, imageUrl):
+        data, hasMoreData = self._get_byte_range(imageUrl=imageUrl, startByte=0, endByte=self.probeByteCount - 1)
+        while True:
+            try:
+                return get_image_size_from_header(data=data)
+            except IncompleteImageHeaderError as error:
+                if not hasMoreData or len(data) >= self.maxProbeByteCount or error.requiredByteCount > self.maxProbeByteCount:
+                    return None
+                content, hasMoreData = self._get_byte_range(imageUrl=imageUrl, startByte=len(data), endByte=min(error.requiredByteCount + self.probeByteCount, self.maxProbeByteCount) - 1)
+                data += content
+
+    def _get_image_size_from_full_image(self, imageUrl):
+        return super().get_image_size(imageUrl=imageUrl)
+
+    def _cache_image_size(self, cacheKey, imageSize):
+        if imageSize is None:
+            return None
+        self.redisConnection.set(cacheKey, '{},{}'.format(*imageSize), ex=self.cacheTtlSeconds)
+        return imageSize
+
+    def get_image_size(self, imageUrl):
+        cacheKey = self._get_cache_key(imageUrl=imageUrl)
+        cachedValue = self.redisConnection.get(cacheKey)
+        if cachedValue is not None and cachedValue != UNREADABLE_HEADER_VALUE:
+            width, height = (int(dimension) for dimension in cachedValue.split(b','))
+            return width, height
+        if cachedValue is None:
+            imageSize = self._probe_image_size(imageUrl=imageUrl)
+            if imageSize is not None:
+                return self._cache_image_size(cacheKey=cacheKey, imageSize=imageSize)
+            self.redisConnection.set(cacheKey, UNREADABLE_HEADER_VALUE, ex=self.unreadableHeaderCacheTtlSeconds)
+        return self._cache_image_size(cacheKey=cacheKey, imageSize=self._get_image_size_from_full_image(imageUrl=imageUrl))
@@ -0,0 +1,26 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ConcurrentImageUrlFilterer:
+
+    def __init__(self, imageUrlFilterer, maxWorkers=16):
+        self.imageUrlFilterer = imageUrlFilterer
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='image-url-filter')
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.imageUrlFilterer, name)
+
+    def _filter_image_url(self, imageUrl):
+        return self.imageUrlFilterer.filter_image_urls(imageUrls=[imageUrl])
+
+    def filter_image_urls(self, imageUrls):
+        uniqueImageUrls = list(collections.OrderedDict.fromkeys(imageUrls))
+        if len(uniqueImageUrls) <= 1:
+            return self.imageUrlFilterer.filter_image_urls(imageUrls=imageUrls)
+        allowedImageUrls = set()
+        for filteredImageUrls in self.executor.map(self._filter_image_url, uniqueImageUrls):
+            allowedImageUrls.update(filteredImageUrls)
+        return [imageUrl for imageUrl in imageUrls if imageUrl in allowedImageUrls]
@@ -0,0 +1,189 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from carbon.util import SettableValueHolder
+
+SQS_MAX_BATCH_SIZE = 10
+
+
+def _get_batches(values, batchSize=SQS_MAX_BATCH_SIZE):
+    return [values[index:index + batchSize] for index in range(0, len(values), batchSize)]
+
+
+class ThreadLocalValueHolder(SettableValueHolder):
+
+    def __init__(self, value):
+        self.defaultValue = value
+        self.threadLocal = threading.local()
+        super().__init__(value=value)
+
+    def get_value(self):
+        return getattr(self.threadLocal, 'value', self.defaultValue)
+
+    def set_value(self, value):
+        self.threadLocal.value = value
+
+
+class BatchingSqsMessageProcessor:
+
+    def __init__(self, requestIdHolder, queueName, region, messageQueue, messageClient, concurrency=1, sqsClient=None, receiveBatchSize=SQS_MAX_BATCH_SIZE, waitTimeSeconds=20, visibilityTimeoutSeconds=60, visibilityExtensionIntervalSeconds=20, deleteFlushIntervalSeconds=1, receiveErrorBackoffSeconds=5, teardownFunctions=None):
+        if concurrency <= 0:
+            raise ValueError('concurrency must be positive')
+        if not 0 < receiveBatchSize <= SQS_MAX_BATCH_SIZE:
+            raise ValueError('receiveBatchSize must be between 1 and {}'.format(SQS_MAX_BATCH_SIZE))
+        if visibilityExtensionIntervalSeconds >= visibilityTimeoutSeconds:
+            raise ValueError('visibilityExtensionIntervalSeconds must be shorter than visibilityTimeoutSeconds')
+        if not callable(getattr(messageClient, 'process_message', None)):
+            raise ValueError('messageClient must provide process_message(message)')
+        if not callable(getattr(messageQueue, 'decode_message', None)):
+            raise ValueError('messageQueue must provide decode_message(sqsMessage)')
+        self.requestIdHolder = requestIdHolder
+        self.queueName = queueName
+        self.messageQueue = messageQueue
+        self.messageClient = messageClient
+        self.concurrency = concurrency
+        self.sqsClient = sqsClient or boto3.client('sqs', region_name=region)
+        self.receiveBatchSize = receiveBatchSize
+        self.waitTimeSeconds = waitTimeSeconds
+        self.visibilityTimeoutSeconds = visibilityTimeoutSeconds
+        self.visibilityExtensionIntervalSeconds = visibilityExtensionIntervalSeconds
+        self.deleteFlushIntervalSeconds = deleteFlushIntervalSeconds
+        self.receiveErrorBackoffSeconds = receiveErrorBackoffSeconds
+        self.teardownFunctions = teardownFunctions or []
+        self.queueUrl = None
+        self.slots = threading.Semaphore(value=concurrency)
+        self.inFlightReceiptHandles = {}
+        self.completedReceiptHandles = []
+        self.lock = threading.Lock()
+        self.deleteEvent = threading.Event()
+        self.stopEvent = threading.Event()
+        self.backgroundStopEvent = threading.Event()
+        self.backgroundFailures = []
+
+    def stop(self):
+        self.stopEvent.set()
+
+    def run(self):
+        self.queueUrl = self.sqsClient.get_queue_url(QueueName=self.queueName)['QueueUrl']
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        backgroundThreads = [
+            self._start_background_thread(target=self._run_visibility_extension_loop, name='sqs-visibility-extension'),
+            self._start_background_thread(target=self._run_delete_loop, name='sqs-batch-delete'),
+        ]
+        try:
+            while not self.stopEvent.is_set():
+                if self.backgroundFailures:
+                    raise RuntimeError('A message queue background thread died') from self.backgroundFailures[0]
+                slotCount = self._acquire_slots()
+                if not slotCount:
+                    continue
+                messages = self._receive_messages(maxMessageCount=slotCount)
+                for _ in range(slotCount - len(messages)):
+                    self.slots.release()
+                for message in messages:
+                    with self.lock:
+                        self.inFlightReceiptHandles[message['MessageId']] = message['ReceiptHandle']
+                    executor.submit(self._process_message, message)
+        finally:
+            executor.shutdown(wait=True)
+            self.stopEvent.set()
+            self.backgroundStopEvent.set()
+            self.deleteEvent.set()
+            for backgroundThread in backgroundThreads:
+                backgroundThread.join()
+            self._delete_completed_messages()
+
+    def _start_background_thread(self, target, name):
+        def run_target():
+            try:
+                target()
+            except BaseException as exception:
+                logging.exception('Message queue background thread %s died', name)
+                self.backgroundFailures.append(exception)
+        thread = threading.Thread(target=run_target, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def _acquire_slots(self):
+        if not self.slots.acquire(timeout=1):
+            return 0
+        slotCount = 1
+        while slotCount < self.receiveBatchSize and self.slots.acquire(blocking=False):
+            slotCount += 1
+        return slotCount
+
+    def _receive_messages(self, maxMessageCount):
+        try:
+            response = self.sqsClient.receive_message(QueueUrl=self.queueUrl, MaxNumberOfMessages=maxMessageCount, WaitTimeSeconds=self.waitTimeSeconds, VisibilityTimeout=self.visibilityTimeoutSeconds, AttributeNames=['All'], MessageAttributeNames=['All'])
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Failed to receive messages from %s', self.queueName)
+            self.stopEvent.wait(self.receiveErrorBackoffSeconds)
+            return []
+        return response.get('Messages', [])
+
+    def _process_message(self, message):
+        isProcessed = False
+        try:
+            self.requestIdHolder.set_value(value=None)
+            self.messageClient.process_message(message=self.messageQueue.decode_message(sqsMessage=message))
+            isProcessed = True
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Failed to process message %s, it will be redelivered', message['MessageId'])
+        finally:
+            with self.lock:
+                receiptHandle = self.inFlightReceiptHandles.pop(message['MessageId'])
+                if isProcessed:
+                    self.completedReceiptHandles.append(receiptHandle)
+                    if len(self.completedReceiptHandles) >= SQS_MAX_BATCH_SIZE:
+                        self.deleteEvent.set()
+            for teardownFunction in self.teardownFunctions:
+                try:
+                    teardownFunction()
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception('Message teardown function failed')
+            self.requestIdHolder.set_value(value=None)
+            self.slots.release()
+
+    def _run_visibility_extension_loop(self):
+        while not self.backgroundStopEvent.wait(self.visibilityExtensionIntervalSeconds):
+            with self.lock:
+                receiptHandles = list(self.inFlightReceiptHandles.values())
+            for receiptHandleBatch in _get_batches(values=receiptHandles):
+                entries = [{'Id': str(index), 'ReceiptHandle': receiptHandle, 'VisibilityTimeout': self.visibilityTimeoutSeconds} for index, receiptHandle in enumerate(receiptHandleBatch)]
+                try:
+                    response = self.sqsClient.change_message_visibility_batch(QueueUrl=self.queueUrl, Entries=entries)
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception('Failed to extend message visibility')
+                    continue
+                for failure in response.get('Failed', []):
+                    logging.warning('Failed to extend message visibility: %s', failure)
+
+    def _run_delete_loop(self):
+        while not self.backgroundStopEvent.is_set():
+            self.deleteEvent.wait(self.deleteFlushIntervalSeconds)
+            self.deleteEvent.clear()
+            self._delete_completed_messages()
+
+    def _delete_completed_messages(self):
+        with self.lock:
+            receiptHandles, self.completedReceiptHandles = self.completedReceiptHandles, []
+        for receiptHandleBatch in _get_batches(values=receiptHandles):
+            entries = [{'Id': str(index), 'ReceiptHandle': receiptHandle} for index, receiptHandle in enumerate(receiptHandleBatch)]
+            try:
+                response = self.sqsClient.delete_message_batch(QueueUrl=self.queueUrl, Entries=entries)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('Failed to delete processed messages, retrying on the next flush')
+                with self.lock:
+                    self.completedReceiptHandles.extend(receiptHandleBatch)
+                continue
+            failedReceiptHandles = []
+            for failure in response.get('Failed', []):
+                logging.warning('Failed to delete processed message: %s', failure)
+                if not failure.get('SenderFault'):
+                    failedReceiptHandles.append(receiptHandleBatch[int(failure['Id'])])
+            if failedReceiptHandles:
+                with self.lock:
+                    self.completedReceiptHandles.extend(failedReceiptHandles)
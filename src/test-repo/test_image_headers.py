@@ -0,0 +1,56 @@
+import struct
+import unittest
+
+from image_headers import IncompleteImageHeaderError
+from image_headers import get_image_size_from_header
+
+
+class GetImageSizeFromHeaderTestCase(unittest.TestCase):
+
+    def test_png(self):
+        data = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', 640, 480) + b'\x08\x02\x00\x00\x00'
+        self.assertEqual(get_image_size_from_header(data=data), (640, 480))
+
+    def test_gif(self):
+        data = b'GIF89a' + struct.pack('<HH', 320, 200) + b'\x00\x00\x00'
+        self.assertEqual(get_image_size_from_header(data=data), (320, 200))
+
+    def test_lossy_webp(self):
+        data = b'RIFF\x00\x00\x00\x00WEBPVP8 ' + b'\x00' * 10 + struct.pack('<HH', 800, 600)
+        self.assertEqual(get_image_size_from_header(data=data), (800, 600))
+
+    def test_lossless_webp(self):
+        bits = (800 - 1) | ((600 - 1) << 14)
+        data = b'RIFF\x00\x00\x00\x00WEBPVP8L' + b'\x00' * 5 + struct.pack('<I', bits)
+        self.assertEqual(get_image_size_from_header(data=data), (800, 600))
+
+    def test_extended_webp(self):
+        data = b'RIFF\x00\x00\x00\x00WEBPVP8X' + b'\x00' * 8 + (800 - 1).to_bytes(3, byteorder='little') + (600 - 1).to_bytes(3, byteorder='little')
+        self.assertEqual(get_image_size_from_header(data=data), (800, 600))
+
+    def test_jpeg_skips_segments_before_start_of_frame(self):
+        app0Segment = b'\xFF\xE0' + struct.pack('>H', 16) + b'JFIF\x00' + b'\x00' * 9
+        startOfFrame = b'\xFF\xC2' + struct.pack('>H', 17) + b'\x08' + struct.pack('>HH', 1080, 1920) + b'\x03' + b'\x00' * 9
+        data = b'\xFF\xD8' + app0Segment + startOfFrame
+        self.assertEqual(get_image_size_from_header(data=data), (1920, 1080))
+
+    def test_truncated_jpeg_reports_the_bytes_it_needs(self):
+        data = b'\xFF\xD8\xFF\xE1' + struct.pack('>H', 1000) + b'\x00' * 10
+        with self.assertRaises(IncompleteImageHeaderError) as context:
+            get_image_size_from_header(data=data)
+        self.assertEqual(context.exception.requiredByteCount, 2 + 2 + 1000 + 9)
+
+    def test_truncated_png_reports_the_bytes_it_needs(self):
+        with self.assertRaises(IncompleteImageHeaderError) as context:
+            get_image_size_from_header(data=b'\x89PNG\r\n\x1a\n\x00\x00')
+        self.assertEqual(context.exception.requiredByteCount, 24)
+
+    def test_corrupt_jpeg(self):
+        self.assertIsNone(get_image_size_from_header(data=b'\xFF\xD8\x00\x00\x00\x00'))
+
+    def test_unknown_format(self):
+        self.assertIsNone(get_image_size_from_header(data=b'<html></html>'))
+
+
+if __name__ == '__main__':
+    unittest.main()
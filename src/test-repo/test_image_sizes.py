@@ -0,0 +1,105 @@
+import struct
+import unittest
+
+from image_sizes import HeaderProbingImageSizeRetriever
+from image_sizes import UNREADABLE_HEADER_VALUE
+
+EXIF_SEGMENT_LENGTH = 20000
+EXIF_JPEG = b'\xFF\xD8\xFF\xE1' + struct.pack('>H', EXIF_SEGMENT_LENGTH) + b'\x00' * (EXIF_SEGMENT_LENGTH - 2) + b'\xFF\xC0' + struct.pack('>H', 17) + b'\x08' + struct.pack('>HH', 1080, 1920) + b'\x00' * 1000
+
+
+class FakeResponse:
+
+    def __init__(self, content, status_code):
+        self.content = content
+        self.status_code = status_code
+
+
+class FakeRequester:
+
+    def __init__(self, images, error=None):
+        self.images = images
+        self.error = error
+        self.ranges = []
+
+    def get(self, url, headers):
+        if self.error is not None:
+            raise self.error
+        startByte, endByte = (int(value) for value in headers['Range'][len('bytes='):].split('-'))
+        self.ranges.append((startByte, endByte))
+        return FakeResponse(content=self.images[url][startByte:endByte + 1], status_code=206)
+
+
+class FakeRedisConnection:
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):  # pylint: disable=unused-argument
+        self.values[key] = value.encode('utf-8') if isinstance(value, str) else value
+
+
+class RecordingImageSizeRetriever(HeaderProbingImageSizeRetriever):
+
+    def __init__(self, fullImageSize=None, fullImageError=None, **kwargs):
+        super().__init__(keyPrefix='penguin', **kwargs)
+        self.fullImageSize = fullImageSize
+        self.fullImageError = fullImageError
+        self.fullImageUrls = []
+
+    def _get_image_size_from_full_image(self, imageUrl):
+        self.fullImageUrls.append(imageUrl)
+        if self.fullImageError is not None:
+            raise self.fullImageError
+        return self.fullImageSize
+
+
+class HeaderProbingImageSizeRetrieverTestCase(unittest.TestCase):
+
+    def test_reads_past_a_large_exif_segment_with_a_second_range_request(self):
+        requester = FakeRequester(images={'https://images/a.jpg': EXIF_JPEG})
+        imageSizeRetriever = RecordingImageSizeRetriever(requester=requester, redisConnection=FakeRedisConnection())
+        self.assertEqual(imageSizeRetriever.get_image_size(imageUrl='https://images/a.jpg'), (1920, 1080))
+        self.assertEqual(requester.ranges, [(0, 8 * 1024 - 1), (8 * 1024, 2 + 2 + EXIF_SEGMENT_LENGTH + 9 + 8 * 1024 - 1)])
+        self.assertEqual(imageSizeRetriever.fullImageUrls, [])
+
+    def test_caches_sizes(self):
+        requester = FakeRequester(images={'https://images/a.jpg': EXIF_JPEG})
+        imageSizeRetriever = RecordingImageSizeRetriever(requester=requester, redisConnection=FakeRedisConnection())
+        imageSizeRetriever.get_image_size(imageUrl='https://images/a.jpg')
+        requestCount = len(requester.ranges)
+        self.assertEqual(imageSizeRetriever.get_image_size(imageUrl='https://images/a.jpg'), (1920, 1080))
+        self.assertEqual(len(requester.ranges), requestCount)
+
+    def test_reraises_transport_errors_without_caching_them(self):
+        redisConnection = FakeRedisConnection()
+        imageSizeRetriever = RecordingImageSizeRetriever(requester=FakeRequester(images={}, error=TimeoutError('timed out')), redisConnection=redisConnection)
+        with self.assertRaises(TimeoutError):
+            imageSizeRetriever.get_image_size(imageUrl='https://images/a.jpg')
+        self.assertEqual(redisConnection.values, {})
+
+    def test_unreadable_headers_fall_back_to_the_full_image(self):
+        redisConnection = FakeRedisConnection()
+        requester = FakeRequester(images={'https://images/a.bmp': b'BM' + b'\x00' * 100})
+        imageSizeRetriever = RecordingImageSizeRetriever(requester=requester, redisConnection=redisConnection, fullImageSize=(10, 20))
+        self.assertEqual(imageSizeRetriever.get_image_size(imageUrl='https://images/a.bmp'), (10, 20))
+        self.assertEqual(imageSizeRetriever.get_image_size(imageUrl='https://images/a.bmp'), (10, 20))
+        self.assertEqual(len(requester.ranges), 1)
+        self.assertEqual(imageSizeRetriever.fullImageUrls, ['https://images/a.bmp'])
+
+    def test_full_image_errors_are_raised_and_skip_the_probe_next_time(self):
+        redisConnection = FakeRedisConnection()
+        requester = FakeRequester(images={'https://images/a.bmp': b'BM' + b'\x00' * 100})
+        imageSizeRetriever = RecordingImageSizeRetriever(requester=requester, redisConnection=redisConnection, fullImageError=ValueError('unsupported image'))
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                imageSizeRetriever.get_image_size(imageUrl='https://images/a.bmp')
+        self.assertEqual(len(requester.ranges), 1)
+        self.assertEqual(list(redisConnection.values.values()), [UNREADABLE_HEADER_VALUE])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import threading
+import unittest
+
+from image_url_filtering import ConcurrentImageUrlFilterer
+
+
+class FakeImageUrlFilterer:
+
+    def __init__(self, blockedImageUrls, concurrentLookupCount=1):
+        self.blockedImageUrls = set(blockedImageUrls)
+        self.barrier = threading.Barrier(parties=concurrentLookupCount, timeout=5)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def filter_image_urls(self, imageUrls):
+        with self.lock:
+            self.calls.append(list(imageUrls))
+        self.barrier.wait()
+        return [imageUrl for imageUrl in imageUrls if imageUrl not in self.blockedImageUrls]
+
+
+class ConcurrentImageUrlFiltererTestCase(unittest.TestCase):
+
+    def test_looks_up_distinct_urls_concurrently_and_keeps_order(self):
+        imageUrlFilterer = FakeImageUrlFilterer(blockedImageUrls=['https://images/b.jpg'], concurrentLookupCount=3)
+        concurrentImageUrlFilterer = ConcurrentImageUrlFilterer(imageUrlFilterer=imageUrlFilterer)
+        imageUrls = ['https://images/c.jpg', 'https://images/a.jpg', 'https://images/b.jpg', 'https://images/c.jpg']
+        self.assertEqual(concurrentImageUrlFilterer.filter_image_urls(imageUrls=imageUrls), ['https://images/c.jpg', 'https://images/a.jpg', 'https://images/c.jpg'])
+        self.assertEqual(sorted(imageUrlFilterer.calls), [['https://images/a.jpg'], ['https://images/b.jpg'], ['https://images/c.jpg']])
+
+    def test_single_url_is_filtered_in_the_calling_thread(self):
+        imageUrlFilterer = FakeImageUrlFilterer(blockedImageUrls=['https://images/a.jpg'])
+        concurrentImageUrlFilterer = ConcurrentImageUrlFilterer(imageUrlFilterer=imageUrlFilterer)
+        self.assertEqual(concurrentImageUrlFilterer.filter_image_urls(imageUrls=['https://images/a.jpg']), [])
+        self.assertEqual(concurrentImageUrlFilterer.filter_image_urls(imageUrls=[]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
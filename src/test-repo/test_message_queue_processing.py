@@ -0,0 +1,166 @@
+import collections
+import threading
+import time
+import unittest
+
+from message_queue_processing import BatchingSqsMessageProcessor
+from message_queue_processing import ThreadLocalValueHolder
+
+
+class InMemorySqsClient:
+
+    def __init__(self, messageBodies, deleteResponses=None):
+        self.queuedMessages = collections.deque({'MessageId': str(index), 'ReceiptHandle': 'receipt-{}'.format(index), 'Body': body} for index, body in enumerate(messageBodies))
+        self.deleteResponses = collections.deque(deleteResponses or [])
+        self.receiveMessageCounts = []
+        self.deleteCalls = []
+        self.deletedReceiptHandles = []
+        self.lock = threading.Lock()
+
+    def get_queue_url(self, QueueName):  # pylint: disable=invalid-name
+        return {'QueueUrl': 'memory://{}'.format(QueueName)}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        with self.lock:
+            self.receiveMessageCounts.append(MaxNumberOfMessages)
+            messages = [self.queuedMessages.popleft() for _ in range(min(MaxNumberOfMessages, len(self.queuedMessages)))]
+        if not messages:
+            time.sleep(0.01)
+        return {'Messages': messages}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):  # pylint: disable=invalid-name,unused-argument
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+
+    def delete_message_batch(self, QueueUrl, Entries):  # pylint: disable=invalid-name,unused-argument
+        with self.lock:
+            self.deleteCalls.append([entry['ReceiptHandle'] for entry in Entries])
+            deleteResponse = self.deleteResponses.popleft() if self.deleteResponses else None
+        if isinstance(deleteResponse, Exception):
+            raise deleteResponse
+        failures = deleteResponse or []
+        failedIds = {failure.get('Id') for failure in failures}
+        with self.lock:
+            self.deletedReceiptHandles.extend(entry['ReceiptHandle'] for entry in Entries if entry['Id'] not in failedIds)
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries if entry['Id'] not in failedIds], 'Failed': failures}
+
+
+class InMemoryMessageQueue:
+
+    def __init__(self, requestIdHolder):
+        self.requestIdHolder = requestIdHolder
+
+    def decode_message(self, sqsMessage):
+        self.requestIdHolder.set_value(value='request-{}'.format(sqsMessage['MessageId']))
+        return sqsMessage['Body']
+
+
+class RecordingMessageClient:
+
+    def __init__(self, requestIdHolder, failingMessages=(), releaseEvent=None):
+        self.requestIdHolder = requestIdHolder
+        self.failingMessages = set(failingMessages)
+        self.releaseEvent = releaseEvent
+        self.startedMessages = []
+        self.processedMessages = []
+        self.requestIds = []
+        self.lock = threading.Lock()
+
+    def process_message(self, message):
+        with self.lock:
+            self.startedMessages.append(message)
+            self.requestIds.append(self.requestIdHolder.get_value())
+        if self.releaseEvent is not None:
+            self.releaseEvent.wait()
+        if message in self.failingMessages:
+            raise ValueError(message)
+        with self.lock:
+            self.processedMessages.append(message)
+
+
+class ProcessorRunner:
+
+    def __init__(self, processor):
+        self.processor = processor
+        self.exception = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            self.processor.run()
+        except Exception as exception:  # pylint: disable=broad-except
+            self.exception = exception
+
+    def stop(self):
+        self.processor.stop()
+        self.thread.join(timeout=10)
+
+
+def _wait_for(condition, timeoutSeconds=5):
+    deadline = time.time() + timeoutSeconds
+    while not condition():
+        if time.time() >= deadline:
+            raise AssertionError('Timed out waiting for condition')
+        time.sleep(0.01)
+
+
+def _make_processor(sqsClient, requestIdHolder, messageClient, concurrency):
+    return BatchingSqsMessageProcessor(requestIdHolder=requestIdHolder, queueName='articles', region=None, messageQueue=InMemoryMessageQueue(requestIdHolder=requestIdHolder), messageClient=messageClient, concurrency=concurrency, sqsClient=sqsClient, waitTimeSeconds=0, visibilityTimeoutSeconds=2, visibilityExtensionIntervalSeconds=0.05, deleteFlushIntervalSeconds=0.01, receiveErrorBackoffSeconds=0.01)
+
+
+class BatchingSqsMessageProcessorTestCase(unittest.TestCase):
+
+    def test_receives_no_more_messages_than_free_slots(self):
+        requestIdHolder = ThreadLocalValueHolder(value=None)
+        releaseEvent = threading.Event()
+        sqsClient = InMemorySqsClient(messageBodies=['message-{}'.format(index) for index in range(10)])
+        messageClient = RecordingMessageClient(requestIdHolder=requestIdHolder, releaseEvent=releaseEvent)
+        runner = ProcessorRunner(processor=_make_processor(sqsClient=sqsClient, requestIdHolder=requestIdHolder, messageClient=messageClient, concurrency=3))
+        try:
+            _wait_for(lambda: len(messageClient.startedMessages) == 3)
+            time.sleep(0.1)
+            self.assertEqual(sqsClient.receiveMessageCounts, [3])
+            self.assertEqual(len(messageClient.startedMessages), 3)
+            releaseEvent.set()
+            _wait_for(lambda: len(messageClient.processedMessages) == 10)
+        finally:
+            releaseEvent.set()
+            runner.stop()
+        self.assertTrue(all(messageCount <= 3 for messageCount in sqsClient.receiveMessageCounts))
+
+    def test_deletes_only_processed_messages_and_sets_their_request_ids(self):
+        requestIdHolder = ThreadLocalValueHolder(value=None)
+        sqsClient = InMemorySqsClient(messageBodies=['good', 'bad'])
+        messageClient = RecordingMessageClient(requestIdHolder=requestIdHolder, failingMessages=['bad'])
+        runner = ProcessorRunner(processor=_make_processor(sqsClient=sqsClient, requestIdHolder=requestIdHolder, messageClient=messageClient, concurrency=2))
+        _wait_for(lambda: len(messageClient.startedMessages) == 2)
+        runner.stop()
+        self.assertIsNone(runner.exception)
+        self.assertEqual(sqsClient.deletedReceiptHandles, ['receipt-0'])
+        self.assertEqual(sorted(messageClient.requestIds), ['request-0', 'request-1'])
+
+    def test_deletes_in_batches_and_retries_failed_deletes(self):
+        requestIdHolder = ThreadLocalValueHolder(value=None)
+        deleteResponses = [ConnectionError('sqs is unavailable'), [{'Id': '0', 'SenderFault': False, 'Code': 'InternalError'}]]
+        sqsClient = InMemorySqsClient(messageBodies=['message-{}'.format(index) for index in range(25)], deleteResponses=deleteResponses)
+        messageClient = RecordingMessageClient(requestIdHolder=requestIdHolder)
+        runner = ProcessorRunner(processor=_make_processor(sqsClient=sqsClient, requestIdHolder=requestIdHolder, messageClient=messageClient, concurrency=5))
+        _wait_for(lambda: len(set(sqsClient.deletedReceiptHandles)) == 25)
+        runner.stop()
+        self.assertIsNone(runner.exception)
+        self.assertTrue(all(len(receiptHandles) <= 10 for receiptHandles in sqsClient.deleteCalls))
+        self.assertLess(len(sqsClient.deleteCalls), 25)
+        self.assertEqual(len(sqsClient.deletedReceiptHandles), 25)
+
+    def test_run_raises_when_a_background_thread_dies(self):
+        requestIdHolder = ThreadLocalValueHolder(value=None)
+        sqsClient = InMemorySqsClient(messageBodies=['message'], deleteResponses=[[{'Code': 'MalformedResponse'}]])
+        messageClient = RecordingMessageClient(requestIdHolder=requestIdHolder)
+        runner = ProcessorRunner(processor=_make_processor(sqsClient=sqsClient, requestIdHolder=requestIdHolder, messageClient=messageClient, concurrency=1))
+        runner.thread.join(timeout=5)
+        self.assertFalse(runner.thread.is_alive())
+        self.assertIsInstance(runner.exception, RuntimeError)
+
+
+if __name__ == '__main__':
+    unittest.main()
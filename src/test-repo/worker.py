@@ -1,15 +1,14 @@
+import os
+
+import boto3
 from babel import BabelClient
 from bap import BapClient
-from carbon.authorization import JwtAuthorizer
-from carbon.caching import DictCache
 from carbon.caching import RedisCache
 from carbon.locking import RedisLockingClient
 from carbon.logging import logging_formatter
-from carbon.messages.message_queues import MessageQueueProcessor
 from carbon.messages.message_queues import SqsMessageQueue
 from carbon.requesters import Requester
 from carbon.storage import S3StorageClient
-from carbon.util import SettableValueHolder
 from carbon.util import http_util
 from lingo import LingoClient
 from monica import MonicaClient
@@ -26,14 +25,12 @@ from penguin.internal import ArticleManager
 from penguin.internal import ArticleProcessor
 from penguin.internal import ArticleQueueMessageClient
 from penguin.internal import ArticleRetrievingClient
-from penguin.internal import ImageSizeRetriever
 from penguin.internal import ImageUrlFilterer
 from penguin.model import constants
 from penguin.store import ArticleMetadataRetriever
 from penguin.store import ArticleSaver
 from penguin.store import ArticleSourcesRetriever
 from penguin.store import ArticleContentRetriever
-from penguin.store import RawArticleStore
 from penguin.store import connections
 from penguin.store.redis_database import ImageUrlStore
 from penguin.store.redis_database import PreCalculatedImageUrlStore
@@ -42,20 +39,72 @@ from guardian import GuardianClient
 from guardian_refreshing import GuardianRefreshingClient
 from journo import JournoClient
 
+from service_common.database_pooling import DatabaseConnectionPool
+from service_common.database_pooling import ThreadLocalDatabaseConnection
+from service_common.jwt_caching import CachingJwtAuthorizer
+from service_common.response_caching import LruCache
+from service_common.response_caching import RedisTtlCache
+from service_common.raw_article_storage import make_raw_article_store
+from service_common.search_indexing import BufferedSearchIndexClient
+from service_common.startup import DependencyContainer
+from service_common.startup import LazyValueHolder
+from service_common.tracing import InstrumentedClient
+from service_common.tracing import Tracer
+
+from image_sizes import HeaderProbingImageSizeRetriever
+from image_url_filtering import ConcurrentImageUrlFilterer
+from message_queue_processing import BatchingSqsMessageProcessor
+from message_queue_processing import ThreadLocalValueHolder
+
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 1))
+REQUEST_CACHE_MAX_BYTES = int(os.environ.get('REQUEST_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+REQUEST_CACHE_TTL_SECONDS = 60 * 5
+REQUEST_CACHE_TTL_SECONDS_BY_CLIENT = {
+    'babel': 60 * 60 * 24,
+    'frank': 60 * 60,
+    'journo': 0,
+    'lingo': 60 * 60 * 24,
+    'pam': 0,
+    'stitch': 60 * 60,
+    'worm': 0,
+}
+RAW_ARTICLE_BUCKET_NAME = os.environ.get('RAW_ARTICLE_BUCKET_NAME')
+DATABASE_POOL_SIZE = int(os.environ['DATABASE_POOL_SIZE']) if os.environ.get('DATABASE_POOL_SIZE') else None
+TRACE_SLOWEST_COUNT = 10
+TRACE_PROFILING_INTERVAL_SECONDS = float(os.environ.get('TRACE_PROFILING_INTERVAL_SECONDS', 0))
+TRACE_STATS_LOGGING_INTERVAL_SECONDS = 60
+
 
-def make_worker(requestIdHolder):
-    dictCache = DictCache()
-    serviceJwtHolder = SettableValueHolder(value=None)
-    requester = Requester(requestIdHolder=requestIdHolder, requestJwtHolder=serviceJwtHolder, caches=[dictCache])
-    guardianClient = GuardianClient(requester=requester)
-    serviceJwt = guardianClient.login_with_password(userId=constants.SERVICE_ID, password=constants.SERVICE_PASSWORD, maxTokenAge=60 * 60)
-    serviceJwtHolder.set_value(value=serviceJwt)
+def make_worker(requestIdHolder, concurrency=1, databasePoolSize=None, tracer=None, sqsClient=None, redisConnection=None, databaseConnectionFactory=connections.get_database, s3Client=None, rawArticleBucketName=RAW_ARTICLE_BUCKET_NAME):
+    if tracer is None:
+        tracer = Tracer(requestIdHolder=requestIdHolder, slowestTraceCount=TRACE_SLOWEST_COUNT, profilingIntervalSeconds=TRACE_PROFILING_INTERVAL_SECONDS)
+    container = DependencyContainer()
+    guardianClient = GuardianClient(requester=Requester(requestIdHolder=requestIdHolder))
+    container.register(name='serviceJwt', factory=guardianClient.login_with_password, userId=constants.SERVICE_ID, password=constants.SERVICE_PASSWORD, maxTokenAge=60 * 60)
+    serviceJwtHolder = LazyValueHolder(container=container, name='serviceJwt')
 
-    databaseConnection = connections.get_database()
-    redisConnection = connections.get_redis_connection()
-    storageClient = S3StorageClient()
-    rawWebpageStore = RawArticleStore(storageClient=storageClient, mimetype=http_util.MIMETYPE_HTML)
-    rawAqmStore = RawArticleStore(storageClient=storageClient, mimetype=http_util.MIMETYPE_JSON)
+    def make_database_connection_pool():
+        return DatabaseConnectionPool(connectionFactory=databaseConnectionFactory, size=databasePoolSize or concurrency, initialConnections=[databaseConnectionFactory()])
+    databaseConnectionPool = container.register(name='databaseConnectionPool', factory=make_database_connection_pool)
+    startupNames = ['serviceJwt', 'databaseConnectionPool', 'storageClient']
+    if redisConnection is None:
+        redisConnection = container.register(name='redisConnection', factory=connections.get_redis_connection)
+        startupNames.append('redisConnection')
+    storageClient = container.register(name='storageClient', factory=S3StorageClient)
+    if s3Client is None:
+        s3Client = container.register(name='s3Client', factory=boto3.client, service_name='s3')
+    container.start(names=startupNames)
+
+    databaseConnection = ThreadLocalDatabaseConnection(connectionPool=databaseConnectionPool)
+    requestCacheMaxTtlSeconds = max([REQUEST_CACHE_TTL_SECONDS] + list(REQUEST_CACHE_TTL_SECONDS_BY_CLIENT.values()))
+    requestCache = LruCache(maxBytes=REQUEST_CACHE_MAX_BYTES, ttlSeconds=requestCacheMaxTtlSeconds)
+    requestRedisCache = RedisTtlCache(redisConnection=redisConnection, keyPrefix='{}-requests'.format(constants.SERVER_BASE_NAME), ttlSeconds=requestCacheMaxTtlSeconds)
+
+    def make_requester(clientName):
+        ttlSeconds = REQUEST_CACHE_TTL_SECONDS_BY_CLIENT.get(clientName, REQUEST_CACHE_TTL_SECONDS)
+        return Requester(requestIdHolder=requestIdHolder, requestJwtHolder=serviceJwtHolder, caches=[requestCache.with_ttl(ttlSeconds=ttlSeconds), requestRedisCache.with_ttl(ttlSeconds=ttlSeconds)])
+    rawWebpageStore = make_raw_article_store(storageClient=storageClient, mimetype=http_util.MIMETYPE_HTML, bucketName=rawArticleBucketName, s3Client=s3Client)
+    rawAqmStore = make_raw_article_store(storageClient=storageClient, mimetype=http_util.MIMETYPE_JSON, bucketName=rawArticleBucketName, s3Client=s3Client)
     redisCache = RedisCache(keyPrefix=constants.SERVER_BASE_NAME, redisConnection=redisConnection)
     redisLockingClient = RedisLockingClient(keyPrefix=constants.SERVER_BASE_NAME, redisConnection=redisConnection)
     imageUrlStore = ImageUrlStore(keyPrefix=constants.SERVER_BASE_NAME)
@@ -64,37 +113,39 @@ def make_worker(requestIdHolder):
     articleMetadataRetriever = ArticleMetadataRetriever()
     articleContentRetriever = ArticleContentRetriever()
     articleSourceRetriever = ArticleSourcesRetriever()
-    articleSearchIndexClient = WormClient(requester=requester)
-    babelClient = BabelClient(requester=requester)
-    bapClient = BapClient(requester=requester)
-    sweepClient = SweepClient(requester=requester)
-    journoClient = JournoClient(requester=requester)
-    monicaClient = MonicaClient(requester=requester)
-    pamClient = PamClient(requester=requester)
-    valveClient = ValveClient(requester=requester)
-    stitchClient = StitchClient(requester=requester)
-    frankClient = FrankClient(requester=requester)
-    lingoClient = LingoClient(requester=requester)
-    picassoClient = PicassoClient(requester=requester)
+    wormClient = InstrumentedClient(client=WormClient(requester=make_requester(clientName='worm')), name='worm', tracer=tracer)
+    articleSearchIndexClient = container.register(name='articleSearchIndexClient', factory=BufferedSearchIndexClient, searchIndexClient=wormClient, redisConnection=redisConnection, keyPrefix=constants.SERVER_BASE_NAME)
+    babelClient = InstrumentedClient(client=BabelClient(requester=make_requester(clientName='babel')), name='babel', tracer=tracer)
+    bapClient = InstrumentedClient(client=BapClient(requester=make_requester(clientName='bap')), name='bap', tracer=tracer)
+    sweepClient = InstrumentedClient(client=SweepClient(requester=make_requester(clientName='sweep')), name='sweep', tracer=tracer)
+    journoClient = InstrumentedClient(client=JournoClient(requester=make_requester(clientName='journo')), name='journo', tracer=tracer)
+    monicaClient = InstrumentedClient(client=MonicaClient(requester=make_requester(clientName='monica')), name='monica', tracer=tracer)
+    pamClient = InstrumentedClient(client=PamClient(requester=make_requester(clientName='pam')), name='pam', tracer=tracer)
+    valveClient = InstrumentedClient(client=ValveClient(requester=make_requester(clientName='valve')), name='valve', tracer=tracer)
+    stitchClient = InstrumentedClient(client=StitchClient(requester=make_requester(clientName='stitch')), name='stitch', tracer=tracer)
+    frankClient = InstrumentedClient(client=FrankClient(requester=make_requester(clientName='frank')), name='frank', tracer=tracer)
+    lingoClient = InstrumentedClient(client=LingoClient(requester=make_requester(clientName='lingo')), name='lingo', tracer=tracer)
+    picassoClient = InstrumentedClient(client=PicassoClient(requester=make_requester(clientName='picasso')), name='picasso', tracer=tracer)
     articleSaver = ArticleSaver()
 
-    imageUrlFilterer = ImageUrlFilterer(imageUrlStore=imageUrlStore, preCalculatedImageUrlStore=preCalculatedImageUrlStore)
+    imageUrlFilterer = InstrumentedClient(client=ConcurrentImageUrlFilterer(imageUrlFilterer=ImageUrlFilterer(imageUrlStore=imageUrlStore, preCalculatedImageUrlStore=preCalculatedImageUrlStore)), name='image_url_filterer', tracer=tracer)
     externalRequester = Requester(requestIdHolder=requestIdHolder)
-    imageSizeRetriever = ImageSizeRetriever(requester=externalRequester)
-    articleRetrievingClient = ArticleRetrievingClient(aqmArticleClient=pamClient, webArticleClient=journoClient)
-    articleManager = ArticleManager(databaseConnection=databaseConnection, rawWebpageStore=rawWebpageStore, rawAqmStore=rawAqmStore, articleMetadataRetriever=articleMetadataRetriever, articleContentRetriever=articleContentRetriever, articleSaver=articleSaver, articleTaggingClient=stitchClient, imageUrlStore=imageUrlStore, preCalculatedImageUrlStore=preCalculatedImageUrlStore, frankClient=frankClient, articleSourceRetriever=articleSourceRetriever, redisConnection=redisConnection, articleSearchIndexClient=articleSearchIndexClient, languageClient=lingoClient)
-    articleProcessor = ArticleProcessor(requester=externalRequester, redisConnection=redisConnection, cache=redisCache, imageSizeRetriever=imageSizeRetriever, imageUrlFilterer=imageUrlFilterer, imageClient=picassoClient, lockingClient=redisLockingClient, articleRetrievingClient=articleRetrievingClient, htmlCleaningClient=sweepClient, htmlProcessingClient=bapClient, switchClient=valveClient, articleManager=articleManager, languageClient=lingoClient, languageTranslatingClient=babelClient)
+    imageSizeRetriever = InstrumentedClient(client=HeaderProbingImageSizeRetriever(requester=externalRequester, redisConnection=redisConnection, keyPrefix=constants.SERVER_BASE_NAME), name='image_size_retriever', tracer=tracer)
+    articleRetrievingClient = InstrumentedClient(client=ArticleRetrievingClient(aqmArticleClient=pamClient, webArticleClient=journoClient), name='article_retrieving_client', tracer=tracer)
+    articleManager = InstrumentedClient(client=ArticleManager(databaseConnection=databaseConnection, rawWebpageStore=rawWebpageStore, rawAqmStore=rawAqmStore, articleMetadataRetriever=articleMetadataRetriever, articleContentRetriever=articleContentRetriever, articleSaver=articleSaver, articleTaggingClient=stitchClient, imageUrlStore=imageUrlStore, preCalculatedImageUrlStore=preCalculatedImageUrlStore, frankClient=frankClient, articleSourceRetriever=articleSourceRetriever, redisConnection=redisConnection, articleSearchIndexClient=articleSearchIndexClient, languageClient=lingoClient), name='article_manager', tracer=tracer)
+    articleProcessor = InstrumentedClient(client=ArticleProcessor(requester=externalRequester, redisConnection=redisConnection, cache=redisCache, imageSizeRetriever=imageSizeRetriever, imageUrlFilterer=imageUrlFilterer, imageClient=picassoClient, lockingClient=redisLockingClient, articleRetrievingClient=articleRetrievingClient, htmlCleaningClient=sweepClient, htmlProcessingClient=bapClient, switchClient=valveClient, articleManager=articleManager, languageClient=lingoClient, languageTranslatingClient=babelClient), name='article_processor', tracer=tracer)
 
-    jwtAuthorizer = JwtAuthorizer(jwtRefreshingClient=GuardianRefreshingClient(requester=Requester(requestIdHolder=requestIdHolder)))
-    articleQueueMessageClient = ArticleQueueMessageClient(jwtAuthorizer=jwtAuthorizer, jwtToRefreshHolder=serviceJwtHolder, articleProcessor=articleProcessor, articleManager=articleManager, hostClient=monicaClient)
+    jwtAuthorizer = CachingJwtAuthorizer(jwtRefreshingClient=GuardianRefreshingClient(requester=Requester(requestIdHolder=requestIdHolder)))
+    articleQueueMessageClient = InstrumentedClient(client=ArticleQueueMessageClient(jwtAuthorizer=jwtAuthorizer, jwtToRefreshHolder=serviceJwtHolder, articleProcessor=articleProcessor, articleManager=articleManager, hostClient=monicaClient), name='article_queue_message_client', tracer=tracer, isRoot=True)
     messageQueue = SqsMessageQueue(name=constants.QUEUE_NAME_ARTICLE_PROCESSING, region=constants.QUEUE_REGION_ARTICLE_PROCESSING, requestIdHolder=requestIdHolder)
-    return MessageQueueProcessor(requestIdHolder=requestIdHolder, messageQueue=messageQueue, messageClient=articleQueueMessageClient)
-
-
-REQUEST_ID_HOLDER = SettableValueHolder(value=None)
-logging_formatter.init_logging(serverName=constants.SERVER_NAME, environment=constants.ENVIRONMENT, version=constants.VERSION, requestIdHolder=REQUEST_ID_HOLDER)
+    messageQueueProcessor = BatchingSqsMessageProcessor(requestIdHolder=requestIdHolder, queueName=constants.QUEUE_NAME_ARTICLE_PROCESSING, region=constants.QUEUE_REGION_ARTICLE_PROCESSING, messageQueue=messageQueue, messageClient=articleQueueMessageClient, concurrency=concurrency, sqsClient=sqsClient, teardownFunctions=[databaseConnection.release_connection])
+    tracer.start_stats_logging(intervalSeconds=TRACE_STATS_LOGGING_INTERVAL_SECONDS)
+    container.start(names=['articleSearchIndexClient'])
+    return messageQueueProcessor
 
-worker = make_worker(requestIdHolder=REQUEST_ID_HOLDER)  # pylint: disable=invalid-name
 
 if __name__ == '__main__':
+    REQUEST_ID_HOLDER = ThreadLocalValueHolder(value=None)
+    logging_formatter.init_logging(serverName=constants.SERVER_NAME, environment=constants.ENVIRONMENT, version=constants.VERSION, requestIdHolder=REQUEST_ID_HOLDER)
+    worker = make_worker(requestIdHolder=REQUEST_ID_HOLDER, concurrency=WORKER_CONCURRENCY, databasePoolSize=DATABASE_POOL_SIZE)  # pylint: disable=invalid-name
     worker.run()